@@ -0,0 +1 @@
+# Reproducible benchmarks for the GatorTaxi engine, run them with `python -m benchmarks --help` from the repository root.
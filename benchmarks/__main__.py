@@ -0,0 +1,181 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from array import array
+
+from gatorTaxi import (RideBoard, cancelRide, getNextRide, insertRide, loadRides, printRide, printRides,
+                       save_snapshot, updateRide)
+from benchmarks.workload import MIXES, Workload, formatCommand
+
+# BENCHMARK DRIVER
+# Every (mix, size) pair is run against a fresh board, either by calling the gator taxi functions directly, which
+# also gives per command latencies, or by feeding the same commands to gatorTaxi.py, which measures the whole CLI.
+# Each run happens in a freshly started process, so its peak RSS is its own and not the largest of the runs before.
+# Results are printed as one JSON document so two revisions can be compared mechanically.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def latencySummary(samples):
+    summary = {}
+    for name, values in samples.items():
+        ordered = sorted(values)
+        summary[name] = {
+            "count": len(ordered),
+            "meanNs": sum(ordered) // len(ordered),
+            "p50Ns": percentile(ordered, 0.5),
+            "p99Ns": percentile(ordered, 0.99),
+            "p999Ns": percentile(ordered, 0.999),
+        }
+    return summary
+
+# Peak resident set size in kilobytes (ru_maxrss is in bytes on macOS). It covers the whole life of the process, or
+# every child waited for, which is why each run gets a process of its own.
+def peakRss(who):
+    rss = resource.getrusage(who).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+def runDirect(workload, ops, compactTree, lazyHeap):
+    board = RideBoard(compactTree=compactTree, lazyHeap=lazyHeap)
+    tree, heap, rides = board.redBlackTree, board.minHeap, board.keyValueDict
+    loadRides(tree, heap, rides, workload.initialRides())
+    commands = list(workload.commands(ops))
+    samples = {}
+    clock = time.perf_counter_ns
+    start = clock()
+    for name, args in commands:
+        began = clock()
+        if name == "Insert":
+            insertRide(tree, heap, rides, *args)
+        elif name == "GetNextRide":
+            getNextRide(tree, heap, rides)
+        elif name == "Print":
+            if len(args) == 1:
+                printRide(tree, heap, rides, *args)
+            else:
+                name = "PrintRange"
+                for _ in printRides(tree, *args):
+                    pass
+        elif name == "UpdateTrip":
+            updateRide(tree, heap, rides, *args)
+        else:
+            cancelRide(tree, heap, rides, *args)
+        elapsed = clock() - began
+        if name not in samples:
+            samples[name] = array('q')
+        samples[name].append(elapsed)
+    seconds = (clock() - start) / 1e9
+    return {
+        "seconds": seconds,
+        "opsPerSec": ops / seconds if seconds else None,
+        "latency": latencySummary(samples),
+        "peakRssKb": peakRss(resource.RUSAGE_SELF),
+    }
+
+def runCli(workload, ops, compactTree, lazyHeap):
+    with tempfile.TemporaryDirectory() as tmp:
+        # the starting board goes in as a snapshot so only the commands themselves are timed
+        board = RideBoard()
+        loadRides(board.redBlackTree, board.minHeap, board.keyValueDict, workload.initialRides())
+        snapshot = os.path.join(tmp, "board.snap")
+        save_snapshot(board, snapshot)
+        del board
+        commandFile = os.path.join(tmp, "commands.txt")
+        with open(commandFile, "w") as f:
+            for name, args in workload.commands(ops):
+                f.write(formatCommand(name, args) + "\n")
+        cmd = [sys.executable, os.path.join(ROOT, "gatorTaxi.py"), commandFile, os.path.join(tmp, "out.txt"),
+               "--load-snapshot", snapshot]
+        if compactTree:
+            cmd.append("--compact-tree")
+        if lazyHeap:
+            cmd.append("--lazy-heap")
+        start = time.perf_counter()
+        subprocess.run(cmd, check=True)
+        seconds = time.perf_counter() - start
+    return {
+        "seconds": seconds,
+        "opsPerSec": ops / seconds if seconds else None,
+        "peakRssKb": peakRss(resource.RUSAGE_CHILDREN),
+    }
+
+# One benchmark run, called in a process of its own through --case
+def runCase(mode, seed, size, mix, ops, compactTree, lazyHeap):
+    run = runDirect if mode == "direct" else runCli
+    return run(Workload(seed, size, mix), ops, compactTree, lazyHeap)
+
+# Start `python -m benchmarks --case` for one run and return what it reports
+def runInProcess(case):
+    proc = subprocess.run([sys.executable, "-m", "benchmarks", "--case", json.dumps(case)], cwd=ROOT, stdout=subprocess.PIPE,
+                          text=True, check=True)
+    return json.loads(proc.stdout)
+
+def revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmark the GatorTaxi engine on seeded synthetic workloads.")
+    parser.add_argument("--mix", action="append", choices=sorted(MIXES), help="operation mix, may be repeated (default: balanced)")
+    parser.add_argument("--size", action="append", type=int, help="rides on the board before the run, may be repeated (default: 1000)")
+    parser.add_argument("--ops", type=int, default=100000, help="commands per run (default: 100000)")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the workload generator (default: 1)")
+    parser.add_argument("--mode", choices=("direct", "cli", "both"), default="direct", help="call the functions, run gatorTaxi.py, or both")
+    parser.add_argument("--compact-tree", action="store_true", help="benchmark the array backed Red Black Tree")
+    parser.add_argument("--heap", choices=("eager", "lazy", "both"), default="eager", help="benchmark the sifting MinHeap, the tombstoning LazyMinHeap, or both")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--write-workload", metavar="PATH", help="only write the command stream of the first mix and size, starting with its Insert commands")
+    # internal: run a single case given as JSON and print its result
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.case:
+        print(json.dumps(runCase(**json.loads(args.case))))
+        return
+    mixes = args.mix or ["balanced"]
+    sizes = args.size or [1000]
+
+    if args.write_workload:
+        workload = Workload(args.seed, sizes[0], mixes[0])
+        with open(args.write_workload, "w") as f:
+            for ride in workload.initialRides():
+                f.write(formatCommand("Insert", ride) + "\n")
+            for name, cmdArgs in workload.commands(args.ops):
+                f.write(formatCommand(name, cmdArgs) + "\n")
+        return
+
+    results = []
+    for mix in mixes:
+        for size in sizes:
+            for mode in (("direct", "cli") if args.mode == "both" else (args.mode,)):
+                for heap in (("eager", "lazy") if args.heap == "both" else (args.heap,)):
+                    # the same seed gives every mode and heap the very same commands
+                    result = {"mix": mix, "size": size, "ops": args.ops, "mode": mode, "heap": heap}
+                    result.update(runInProcess({"mode": mode, "seed": args.seed, "size": size, "mix": mix, "ops": args.ops,
+                                                "compactTree": args.compact_tree, "lazyHeap": heap == "lazy"}))
+                    results.append(result)
+    report = {
+        "revision": revision(),
+        "python": platform.python_version(),
+        "seed": args.seed,
+        "compactTree": args.compact_tree,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
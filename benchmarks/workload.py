@@ -0,0 +1,69 @@
+import random
+
+# SYNTHETIC WORKLOADS
+# Seeded command streams in the same syntax as input.txt. A stream starts from a board of `size` rides and then
+# issues `ops` commands drawn from an operation mix. The generator only remembers which rideNumbers it handed out,
+# so some commands hit rides that GetNextRide or a declined update already removed, just like real traffic.
+
+# Relative weight of every command type in each mix
+MIXES = {
+    "balanced": {"Insert": 20, "GetNextRide": 15, "Print": 20, "PrintRange": 10, "UpdateTrip": 20, "CancelRide": 15},
+    "insert-heavy": {"Insert": 60, "GetNextRide": 10, "Print": 10, "PrintRange": 5, "UpdateTrip": 10, "CancelRide": 5},
+    "update-heavy": {"Insert": 10, "GetNextRide": 10, "Print": 10, "PrintRange": 5, "UpdateTrip": 60, "CancelRide": 5},
+    "cancel-heavy": {"Insert": 30, "GetNextRide": 10, "Print": 5, "PrintRange": 5, "UpdateTrip": 10, "CancelRide": 40},
+    "range-print-heavy": {"Insert": 10, "GetNextRide": 5, "Print": 15, "PrintRange": 50, "UpdateTrip": 10, "CancelRide": 10},
+}
+
+MAX_COST = 1000000
+MAX_DURATION = 10000
+# rideNumbers grow by a random step of at most this much, so they stay unique without a set
+MAX_STEP = 10
+# a range print spans about this many consecutive rideNumbers' worth of rides
+RANGE_RIDES = 10
+
+class Workload:
+    def __init__(self, seed, size, mix="balanced"):
+        self.random = random.Random(seed)
+        self.size = size
+        self.weights = MIXES[mix]
+        self.lastRideNumber = 0
+        # rideNumbers handed out and not cancelled by the generator
+        self.pool = []
+
+    def newRide(self):
+        r = self.random
+        self.lastRideNumber += r.randint(1, MAX_STEP)
+        self.pool.append(self.lastRideNumber)
+        return (self.lastRideNumber, r.randint(1, MAX_COST), r.randint(1, MAX_DURATION))
+
+    # The (rideNumber, rideCost, tripDuration) triplets of the starting board
+    def initialRides(self):
+        return [self.newRide() for _ in range(self.size)]
+
+    # Yield `ops` commands as (name, args) pairs; PrintRange is emitted as a two argument Print
+    def commands(self, ops):
+        r = self.random
+        names = list(self.weights)
+        kinds = r.choices(names, weights=[self.weights[n] for n in names], k=ops)
+        pool = self.pool
+        for kind in kinds:
+            if kind == "Insert" or not pool:
+                yield "Insert", self.newRide()
+            elif kind == "GetNextRide":
+                yield "GetNextRide", ()
+            elif kind == "Print":
+                yield "Print", (r.choice(pool),)
+            elif kind == "PrintRange":
+                low = r.randint(1, self.lastRideNumber)
+                yield "Print", (low, low + RANGE_RIDES * MAX_STEP // 2)
+            elif kind == "UpdateTrip":
+                yield "UpdateTrip", (r.choice(pool), r.randint(1, 2 * MAX_DURATION))
+            else:
+                # swap the cancelled ride to the end of the pool so removing it is O(1)
+                index = r.randrange(len(pool))
+                pool[index], pool[-1] = pool[-1], pool[index]
+                yield "CancelRide", (pool.pop(),)
+
+# Render a command the way it appears in an input file
+def formatCommand(name, args):
+    return "%s(%s)" % (name, ",".join(map(str, args)))
@@ -0,0 +1,147 @@
+import collections
+import threading
+from concurrent.futures import Future
+
+# CONCURRENT RIDE BOARD
+# A RideBoard shared between threads. Mutations are appended to a single writer queue and applied in order by
+# whichever thread currently holds the writer role, in batches under the write side of a reader-writer lock, while any
+# number of threads run Print, Count, Rank, Select, PrintPage and PeekNextRides under the read side. Reads only ever
+# wait for the batch being applied, never for the queue of mutations behind it, and they never wait for each other.
+# Draining the queue on a mutating thread instead of a dedicated writer thread spares every uncontended mutation two
+# thread switches, which under the GIL cost far more than the mutation itself.
+
+# Most queued mutations applied under one acquisition of the write lock
+WRITE_BATCH = 64
+
+# Many readers or one writer. A writer waiting for the readers to drain holds new readers back, so a steady stream of
+# reads cannot starve the writer; since one thread writes at a time a read waits for at most one batch.
+class ReadWriteLock:
+    def __init__(self):
+        self.cond = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.writing = False
+        self.writerWaiting = False
+
+    def acquireRead(self):
+        with self.cond:
+            while self.writing or self.writerWaiting:
+                self.cond.wait()
+            self.readers += 1
+
+    def releaseRead(self):
+        with self.cond:
+            self.readers -= 1
+            if self.readers == 0:
+                self.cond.notify_all()
+
+    def acquireWrite(self):
+        with self.cond:
+            self.writerWaiting = True
+            while self.writing or self.readers:
+                self.cond.wait()
+            self.writerWaiting = False
+            self.writing = True
+
+    def releaseWrite(self):
+        with self.cond:
+            self.writing = False
+            self.cond.notify_all()
+
+class ConcurrentBoard:
+    # Offers the RideBoard methods the command handlers use, so processCommands and the server work on it unchanged.
+    # A mutation called from any thread returns once it has been applied, with what RideBoard returned.
+    def __init__(self, board, writeBatch=WRITE_BATCH):
+        self.board = board
+        self.writeBatch = writeBatch
+        self.lock = ReadWriteLock()
+        self.writes = collections.deque()
+        # held by the thread currently draining the writer queue
+        self.writer = threading.Lock()
+
+    # Queue fn(*args) behind every mutation queued so far and return a Future for its result.
+    # The caller then drains the queue itself unless another thread is already at it; that thread also applies this
+    # mutation, or leaves it to the next caller if it finished before the mutation was queued.
+    def submit(self, fn, *args):
+        future = Future()
+        self.writes.append((fn, args, future))
+        with self.writer:
+            self.applyWrites()
+        return future
+
+    def applyWrites(self):
+        writes = self.writes
+        while writes:
+            self.lock.acquireWrite()
+            try:
+                for _ in range(min(len(writes), self.writeBatch)):
+                    fn, args, future = writes.popleft()
+                    try:
+                        future.set_result(fn(*args))
+                    except Exception as e:
+                        future.set_exception(e)
+            finally:
+                self.lock.releaseWrite()
+
+    def read(self, fn, *args):
+        self.lock.acquireRead()
+        try:
+            return fn(*args)
+        finally:
+            self.lock.releaseRead()
+
+    # Mutations, serialized through the writer queue
+    def insert(self, rideNumber, rideCost, tripDuration, ttl=0, pickup=None):
+        return self.submit(self.board.insert, rideNumber, rideCost, tripDuration, ttl, pickup).result()
+
+    def advance(self, t):
+        return self.submit(self.board.advance, t).result()
+
+    def update(self, rideNumber, newTD):
+        return self.submit(self.board.update, rideNumber, newTD).result()
+
+    def cancel(self, rideNumber):
+        return self.submit(self.board.cancel, rideNumber).result()
+
+    def updateMany(self, rideNumbers, newDurations):
+        return self.submit(self.board.updateMany, rideNumbers, newDurations).result()
+
+    def cancelMany(self, rideNumbers):
+        return self.submit(self.board.cancelMany, rideNumbers).result()
+
+    def nextRide(self):
+        return self.submit(self.board.nextRide).result()
+
+    def nextRides(self, k):
+        return self.submit(self.board.nextRides, k).result()
+
+    def nextRideNear(self, x, y, radius):
+        return self.submit(self.board.nextRideNear, x, y, radius).result()
+
+    # Reads, run on the calling thread. Range results are collected under the lock since the tree may change after it.
+    def printRide(self, rideNumber):
+        return self.read(self.board.printRide, rideNumber)
+
+    def printRides(self, rideNumber1, rideNumber2):
+        return self.read(lambda: list(self.board.printRides(rideNumber1, rideNumber2)))
+
+    def peekNextRides(self, k):
+        return self.read(self.board.peekNextRides, k)
+
+    def count(self, rideNumber1, rideNumber2):
+        return self.read(self.board.count, rideNumber1, rideNumber2)
+
+    def rank(self, rideNumber):
+        return self.read(self.board.rank, rideNumber)
+
+    def select(self, index):
+        return self.read(self.board.select, index)
+
+    def printPage(self, rideNumber1, rideNumber2, offset, limit):
+        return self.read(self.board.printPage, rideNumber1, rideNumber2, offset, limit)
+
+    # Past versions never change, so only finding one takes the lock and the scan runs while writers go on
+    def printRidesAt(self, version, rideNumber1, rideNumber2):
+        tree = self.read(self.board.versionAt, version)
+        if tree is None:
+            return None
+        return [(rideNumber, value[0], value[1]) for rideNumber, value in tree.rangeItems(rideNumber1, rideNumber2)]
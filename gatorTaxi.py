@@ -1,117 +1,378 @@
+import argparse
+import bisect
+import heapq
+import itertools
+import json
+import mmap
+import os
+import struct
 import sys
+import time
+import zlib
+from array import array
 
-# Define a Ride class
+# NumPy is optional, batches of UpdateTrip requests are classified with it when it is installed
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# A ride record, stored once and shared by the tree, the heap and the lookup dictionary.
+# It carries handles into the heap and the tree so a ride can be removed without searching for it again.
 class Ride:
-    # Define the initialization method of the Ride class
+    __slots__ = ("rideNumber", "rideCost", "tripDuration", "arrival", "heapIndex", "node", "deadline", "timerSlot",
+                 "pickup", "cell")
+
+    # process wide creation counter, for the oldest first priority policy
+    arrivals = itertools.count()
+
     def __init__(self, rideNumber, rideCost, tripDuration):
-        # Initialize the rideNumber,rideCost, tripDuration attributes with the values passed as parameters
         self.rideNumber = rideNumber
         self.rideCost = rideCost
         self.tripDuration = tripDuration
+        self.arrival = next(Ride.arrivals)
+        # position of the ride in MinHeap.heap (its live stamp in a LazyMinHeap), -1 while the ride is not in the heap
+        self.heapIndex = -1
+        # handle of the ride's node in the Red Black Tree
+        self.node = None
+        # tick at which the ride expires and the TimingWheel slot holding it, None for rides without a TTL
+        self.deadline = None
+        self.timerSlot = None
+        # (x, y) pickup coordinates and the PickupGrid cell holding the ride, None for rides inserted without them
+        self.pickup = None
+        self.cell = None
+
+# PRIORITY POLICIES
+# A policy maps a ride to the key the heap orders it by, smallest first. The key is computed once when the ride enters
+# the heap or changes, so sifts compare one precomputed value whatever the policy. Every key ends in something unique
+# to the ride, so ties are always broken the same way. Keys are flat tuples so LazyMinHeap can extend them in place.
+
+# The default order: cheapest ride, then shortest trip, then lowest rideNumber
+def costPriority(ride):
+    return (ride.rideCost, ride.tripDuration, ride.rideNumber)
+
+# Cheapest per minute of trip first, rides without a duration go last
+def costPerMinutePriority(ride):
+    perMinute = ride.rideCost / ride.tripDuration if ride.tripDuration > 0 else float("inf")
+    return (perMinute, ride.rideCost, ride.tripDuration, ride.rideNumber)
+
+# Cheapest once a per minute surge surcharge is added to the cost
+def surgePriority(surge):
+    def priority(ride):
+        return (ride.rideCost + surge * ride.tripDuration, ride.rideCost, ride.tripDuration, ride.rideNumber)
+    return priority
+
+# Rides in the order they were created, an update keeps a ride's place
+def oldestFirstPriority(ride):
+    return (ride.arrival,)
+
+PRIORITY_POLICIES = {
+    "cost": lambda surge: costPriority,
+    "cost-per-minute": lambda surge: costPerMinutePriority,
+    "surge": surgePriority,
+    "oldest-first": lambda surge: oldestFirstPriority,
+}
 
 # Min Heaps work on the rides with RideNumber , rideCost and tripDuration.
+# heap[i] is a Ride record and keys[i] its key under the heap's priority policy, by default the packed
+# (rideCost, tripDuration, rideNumber) tuple, so a single comparison orders two rides.
 class MinHeap:
-    def __init__(self):
+    def __init__(self, priority=costPriority):
         self.heap = []
-        self.positions = {}
+        self.keys = []
+        self.priority = priority
+        # optional EngineStats collecting sift depths
+        self.stats = None
+
+    def __len__(self):
+        return len(self.heap)
 
-   # Insert a new ride into the heap
+    # Insert a new ride into the heap
     def insert(self, ride):
-        # Add the new ride to the end of the heap
+        # Add the new ride to the end of the heap and reorder the heap to satisfy the heap property
+        ride.heapIndex = len(self.heap)
         self.heap.append(ride)
-        # Store the position of the new ride in the positions dictionary
-        index = len(self.heap)-1
-        self.positions[ride.rideNumber] = index
-        # Reorder the heap to satisfy the heap property
-        self.heapifyUp(index)
+        self.keys.append(self.priority(ride))
+        self.heapifyUp(ride.heapIndex)
+
+    # Return the ride with the minimum rideCost without removing it, or None if the heap is empty
+    def peek(self):
+        return self.heap[0] if self.heap else None
 
     # Remove and return the ride with the minimum rideCost from the heap
     def extract_min(self):
+        heap = self.heap
         # If the heap is empty, return None
-        if len(self.heap) == 0:
+        if not heap:
             return None
-        # If the heap contains only one ride, remove and return it
-        if len(self.heap) == 1:
-            ride = self.heap.pop()
-            self.positions.pop(ride.rideNumber)
-            return ride
-        # Otherwise, remove the ride with minimum rideCost from the root
-        min_val = self.heap[0]
-        # Replace the root with the last ride in the heap
-        self.heap[0] = self.heap.pop()
-        # Update the position of the new root in the positions dictionary
-        self.positions.pop(min_val.rideNumber)
-        self.positions[self.heap[0].rideNumber] = 0
-        # Reorder the heap to satisfy the heap property
+        # Replace the root with the last ride in the heap and sift it down
+        last = heap.pop()
+        lastKey = self.keys.pop()
+        if not heap:
+            last.heapIndex = -1
+            return last
+        min_val = heap[0]
+        min_val.heapIndex = -1
+        heap[0] = last
+        self.keys[0] = lastKey
         self.heapifyDown(0)
-        # Return the ride with minimum rideCost
         return min_val
 
-    # Remove a ride from the heap
+    # Remove the ride from the heap through its heapIndex, return False if it is not in the heap
     def delete(self, ride):
-        # If the heap is empty, return False
-        if len(self.heap) == 0:
-            return False
-        # If the ride is not in the heap, return False
-        if ride.rideNumber not in self.positions:
+        index = ride.heapIndex
+        if index < 0:
             return False
-        # Find the position of the ride in the heap
-        index = self.positions[ride.rideNumber]
-        # Replace the ride with the last ride in the heap
-        self.heap[index] = self.heap[-1]
-        # Update the position of the last ride in the positions dictionary
-        self.positions[self.heap[-1].rideNumber] = index
-        # Remove the last ride from the heap
-        self.heap.pop()
-        # Remove the ride from the positions dictionary
-        del self.positions[ride.rideNumber]
-        # Reorder the heap to satisfy the heap property
-        if index == len(self.heap):
+        ride.heapIndex = -1
+        heap = self.heap
+        keys = self.keys
+        removed = keys[index]
+        last = heap.pop()
+        lastKey = keys.pop()
+        # If the removed ride was the tail there is nothing to reorder
+        if index == len(heap):
             return True
-        self.heapifyUp(index)
-        self.heapifyDown(index)
+        # Otherwise the tail fills the hole and moves in the one direction the heap property requires
+        heap[index] = last
+        keys[index] = lastKey
+        if lastKey < removed:
+            self.heapifyUp(index)
+        else:
+            self.heapifyDown(index)
         return True
 
-    # Reorder the heap from the given index to the root to satisfy the heap property
+    # Give a ride a new rideCost and tripDuration in place, moving it up or down as needed
+    def change_key(self, ride, newCost, newDuration):
+        ride.rideCost = newCost
+        ride.tripDuration = newDuration
+        index = ride.heapIndex
+        key = self.priority(ride)
+        old = self.keys[index]
+        self.keys[index] = key
+        if key < old:
+            self.heapifyUp(index)
+        else:
+            self.heapifyDown(index)
+
+    # Return the k cheapest rides in order without touching the heap.
+    # A small auxiliary heap of (key, index) pairs starts at the root and every ride taken from it offers its two
+    # children, so only O(k) slots of the heap are ever looked at and the walk costs O(k log k).
+    def peekSmallest(self, k):
+        heap = self.heap
+        keys = self.keys
+        size = len(heap)
+        rides = []
+        frontier = [(keys[0], 0)] if size else []
+        while frontier and len(rides) < k:
+            _, index = heapq.heappop(frontier)
+            rides.append(heap[index])
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < size:
+                    heapq.heappush(frontier, (keys[child], child))
+        return rides
+
+    # Key of the smallest ride, or None if the heap is empty
+    def minKey(self):
+        return self.keys[0] if self.keys else None
+
+    # Add many rides at once and restore the heap property bottom-up in O(n) instead of sifting each one up
+    def heapify(self, rides):
+        heap = self.heap
+        keys = self.keys
+        for ride in rides:
+            ride.heapIndex = len(heap)
+            heap.append(ride)
+            keys.append(self.priority(ride))
+        for index in range(len(heap) // 2 - 1, -1, -1):
+            self.heapifyDown(index)
+
+    # Replace everything in the heap with the given rides in O(n)
+    def rebuild(self, rides):
+        for ride in self.heap:
+            ride.heapIndex = -1
+        self.heap = []
+        self.keys = []
+        self.heapify(rides)
+
+    # Switch to another priority policy, recomputing every key and rebuilding the heap bottom-up in O(n)
+    def setPriority(self, priority):
+        self.priority = priority
+        self.keys = [priority(ride) for ride in self.heap]
+        for index in range(len(self.heap) // 2 - 1, -1, -1):
+            self.heapifyDown(index)
+
+    # Move the ride at index towards the root until its parent is smaller.
+    # The ride is held aside and parents slide down into the hole, so each level costs one store instead of a swap.
     def heapifyUp(self, index):
-        # Find the position of the parent node
-        prtNode = (index - 1) // 2 # parent Node
-        # If the parent node is valid and the child node violates the heap property, swap them and continue with the parent node
-        if prtNode >= 0 and (self.heap[prtNode].rideCost > self.heap[index].rideCost or (self.heap[prtNode].rideCost == self.heap[index].rideCost and self.heap[prtNode].tripDuration > self.heap[index].tripDuration)):
-            self.swap(index, prtNode)
-            self.heapifyUp(prtNode)
+        heap = self.heap
+        keys = self.keys
+        start = index
+        ride = heap[index]
+        key = keys[index]
+        while index > 0:
+            prtNode = (index - 1) >> 1 # parent Node
+            parentKey = keys[prtNode]
+            if parentKey < key:
+                break
+            parent = heap[prtNode]
+            heap[index] = parent
+            keys[index] = parentKey
+            parent.heapIndex = index
+            index = prtNode
+        heap[index] = ride
+        keys[index] = key
+        ride.heapIndex = index
+        if self.stats is not None:
+            # every level climbed moved one ride down, the depth of slot i is the bit length of i + 1 minus one
+            self.stats.siftUp((start + 1).bit_length() - (index + 1).bit_length())
 
+    # Move the ride at index towards the leaves until both children are larger
     def heapifyDown(self, index):
-        # Calculate indices of the left and right child nodes
-        lchild = index * 2 + 1
-        rchild = index * 2 + 2
-        # Set the minimum index to the current index
-        minimum = index
-        # Check if the left child node exists and has a lower ride cost or has the same ride cost but a shorter trip duration
-        if (lchild < len(self.heap) and 
-            (self.heap[lchild].rideCost < self.heap[minimum].rideCost or 
-            (self.heap[lchild].rideCost == self.heap[minimum].rideCost and 
-            self.heap[lchild].tripDuration < self.heap[minimum].tripDuration))):
-            minimum = lchild
-        # Check if the right child node exists and has a lower ride cost or has the same ride cost but a shorter trip duration
-        if (rchild < len(self.heap) and 
-            (self.heap[rchild].rideCost < self.heap[minimum].rideCost or 
-            (self.heap[rchild].rideCost == self.heap[minimum].rideCost and 
-            self.heap[rchild].tripDuration < self.heap[minimum].tripDuration))):
-            minimum = rchild
-        # If the minimum index has changed, swap the nodes and recursively call heapifyDown on the new index
-        if minimum != index:
-            self.swap(index, minimum)
-            self.heapifyDown(minimum)
-
-
-    def swap(self, i, j):
-        # Update the positions of the two rides in the heap
-        self.positions[self.heap[i].rideNumber] = j
-        self.positions[self.heap[j].rideNumber] = i
-        
-        # Swap the two rides in the heap
-        self.heap[i], self.heap[j] = self.heap[j], self.heap[i]
+        heap = self.heap
+        keys = self.keys
+        size = len(heap)
+        start = index
+        ride = heap[index]
+        key = keys[index]
+        lchild = 2 * index + 1
+        while lchild < size:
+            # pick the smaller of the two children
+            rchild = lchild + 1
+            if rchild < size and keys[rchild] < keys[lchild]:
+                lchild = rchild
+            childKey = keys[lchild]
+            if key < childKey:
+                break
+            child = heap[lchild]
+            heap[index] = child
+            keys[index] = childKey
+            child.heapIndex = index
+            index = lchild
+            lchild = 2 * index + 1
+        heap[index] = ride
+        keys[index] = key
+        ride.heapIndex = index
+        if self.stats is not None:
+            self.stats.siftDown((index + 1).bit_length() - (start + 1).bit_length())
+
+
+# Lazy deletion alternative to MinHeap for cancel heavy traffic.
+# delete and change_key never sift: a ride is stamped with a fresh generation number every time it enters the heap,
+# and ride.heapIndex holds that stamp while the ride is live. heap entries are the ride's key from the same priority
+# policy as MinHeap extended with (stamp, ride), kept in order by heapq, so rides compare exactly like there and one
+# flat tuple comparison still orders two entries. An entry whose stamp no longer matches its ride is a tombstone that
+# extract_min and peek skip. Once tombstones pass compactFraction of the entries the heap is rebuilt from the live ones
+# in O(live).
+class LazyMinHeap:
+    def __init__(self, compactFraction=0.5, priority=costPriority):
+        self.heap = []
+        self.priority = priority
+        self.live = 0
+        self.generation = 0
+        self.compactFraction = compactFraction
+        # optional EngineStats counting tombstones and compactions
+        self.stats = None
+
+    def __len__(self):
+        return self.live
+
+    def entry(self, ride):
+        stamp = self.generation
+        self.generation += 1
+        ride.heapIndex = stamp
+        return self.priority(ride) + (stamp, ride)
+
+    def insert(self, ride):
+        heapq.heappush(self.heap, self.entry(ride))
+        self.live += 1
+
+    # Drop the tombstones sitting on top of the heap so heap[0] is live
+    def skipDead(self):
+        heap = self.heap
+        skipped = 0
+        while heap and heap[0][-1].heapIndex != heap[0][-2]:
+            heapq.heappop(heap)
+            skipped += 1
+        if skipped and self.stats is not None:
+            self.stats.heapTombstones += skipped
+
+    def peek(self):
+        self.skipDead()
+        return self.heap[0][-1] if self.heap else None
+
+    def extract_min(self):
+        self.skipDead()
+        if not self.heap:
+            return None
+        ride = heapq.heappop(self.heap)[-1]
+        ride.heapIndex = -1
+        self.live -= 1
+        return ride
+
+    # Mark the ride's entry dead, return False if it is not in the heap
+    def delete(self, ride):
+        if ride.heapIndex < 0:
+            return False
+        ride.heapIndex = -1
+        self.live -= 1
+        self.compactIfNeeded()
+        return True
+
+    # The old entry dies with the old stamp and a new one is pushed with the new key
+    def change_key(self, ride, newCost, newDuration):
+        ride.rideCost = newCost
+        ride.tripDuration = newDuration
+        heapq.heappush(self.heap, self.entry(ride))
+        self.compactIfNeeded()
+
+    def compactIfNeeded(self):
+        heap = self.heap
+        if len(heap) - self.live > self.compactFraction * len(heap):
+            heap[:] = [entry for entry in heap if entry[-1].heapIndex == entry[-2]]
+            heapq.heapify(heap)
+            if self.stats is not None:
+                self.stats.heapCompactions += 1
+
+    # Same walk as MinHeap.peekSmallest, except tombstones are passed through without being counted
+    def peekSmallest(self, k):
+        heap = self.heap
+        size = len(heap)
+        rides = []
+        frontier = [(heap[0], 0)] if size else []
+        while frontier and len(rides) < k:
+            entry, index = heapq.heappop(frontier)
+            if entry[-1].heapIndex == entry[-2]:
+                rides.append(entry[-1])
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < size:
+                    heapq.heappush(frontier, (heap[child], child))
+        return rides
+
+    def heapify(self, rides):
+        heap = self.heap
+        for ride in rides:
+            heap.append(self.entry(ride))
+            self.live += 1
+        heapq.heapify(heap)
+
+    def rebuild(self, rides):
+        for entry in self.heap:
+            entry[-1].heapIndex = -1
+        self.heap = []
+        self.live = 0
+        self.heapify(rides)
+
+    # Restamp the live rides under the new policy and rebuild, which also drops every tombstone
+    def setPriority(self, priority):
+        self.priority = priority
+        live = [entry[-1] for entry in self.heap if entry[-1].heapIndex == entry[-2]]
+        self.heap = [self.entry(ride) for ride in live]
+        heapq.heapify(self.heap)
+
+    # Key of the smallest ride, or None if the heap is empty
+    def minKey(self):
+        self.skipDead()
+        return self.heap[0][:-2] if self.heap else None
 
 
 
@@ -119,12 +380,16 @@ class Node():
     def __init__(self, data):
         # Initialize the data of the node
         self.data = data 
+        # Initialize the value stored alongside the key (the Ride record)
+        self.value = None
         # Initialize the parent, left child, and right child of the node
         self.parent = None 
         self.left = None 
         self.right = None 
         # Initialize the color of the node (1 for red, 0 for black)
         self.color = 1
+        # Initialize the number of nodes in the subtree rooted at this node
+        self.size = 1
 
 
 # class RedBlackTree implements the operations in Red Black Tree
@@ -133,9 +398,12 @@ class RedBlackTree():
         # Initialize null node with color 0 as the sentinel node
         self.TNULL = Node(0)
         self.TNULL.color = 0
+        self.TNULL.size = 0
         self.TNULL.left = None
         self.TNULL.right = None
         self.root = self.TNULL
+        # optional EngineStats counting rotations and fix-up iterations
+        self.stats = None
 
     def searchNode(self, node, key):
         # Search for the node with the given key starting from the given node
@@ -147,8 +415,11 @@ class RedBlackTree():
 
     
     def deleteRotationHelper(self, currNode):
+        stats = self.stats
         # Fix the tree after node deletion
         while currNode != self.root and currNode.color == 0:
+            if stats is not None:
+                stats.deleteFixups += 1
             # If the node is the left child of its parent
             if currNode == currNode.parent.left:
                 # Get the sibling node of the current node
@@ -235,6 +506,15 @@ class RedBlackTree():
                 node = node.left
         if z == self.TNULL:  # If the node to be deleted was not found, return
             return
+        self.deleteHandle(z)
+
+    # Helper function to delete a node the caller already holds, without searching for it
+    def deleteHandle(self, z):
+        # Every subtree that loses a node shrinks by one: the ancestors of z, or of its successor when z has two children
+        node = z.parent if z.left == self.TNULL or z.right == self.TNULL else self.minimum(z.right).parent
+        while node is not None:
+            node.size -= 1
+            node = node.parent
         copy = z  # Create a copy of the node to be deleted
         copyColor = copy.color  # Store the color of the copied node
         if z.left == self.TNULL:  # If the node to be deleted has no left child, set the child node to be the right child
@@ -257,13 +537,17 @@ class RedBlackTree():
             copy.left = z.left  # Set the left child of the copied node to be the left child of the node to be deleted
             copy.left.parent = copy  # Set the parent of the left child to be the copied node
             copy.color = z.color  # Set the color
+            copy.size = z.size  # The successor now roots the subtree z used to root
 
         if copyColor == 0:
             self.deleteRotationHelper(childNode)
 
     def insertRotationHelper(self, key):
+        stats = self.stats
         # While the parent of the current node is red
         while key.parent.color == 1:
+            if stats is not None:
+                stats.insertFixups += 1
             # If the parent is the right child of the grandparent
             if key.parent == key.parent.parent.right:
                 uncle = key.parent.parent.left # uncle node
@@ -308,6 +592,75 @@ class RedBlackTree():
     def searchTree(self, key):
         return self.searchNode(self.root, key)
 
+    # A function to yield the nodes with keys in [low, high] in ascending order.
+    # Subtrees lying entirely outside the bounds are never visited and an explicit stack replaces recursion,
+    # so a scan costs O(log n + k) for k matching nodes.
+    def rangeScan(self, low, high):
+        TNULL = self.TNULL
+        stack = []
+        node = self.root
+        while stack or node is not TNULL:
+            if node is not TNULL:
+                if node.data < low:
+                    # the node and its left subtree are below the range
+                    node = node.right
+                else:
+                    stack.append(node)
+                    node = node.left
+            else:
+                node = stack.pop()
+                # every remaining node is above the range
+                if node.data > high:
+                    return
+                yield node
+                node = node.right
+
+    # A function to yield the (key, value) pairs with keys in [low, high] in ascending order
+    def rangeItems(self, low, high):
+        for node in self.rangeScan(low, high):
+            yield node.data, node.value
+
+    # A function to count the keys smaller than key in O(log n) using the subtree sizes
+    def countLess(self, key):
+        TNULL = self.TNULL
+        node = self.root
+        count = 0
+        while node is not TNULL:
+            if node.data < key:
+                count += node.left.size + 1
+                node = node.right
+            else:
+                node = node.left
+        return count
+
+    # A function to find the (key, value) pair with the given 0-based rank in O(log n), or None if there is none
+    def selectItem(self, index):
+        TNULL = self.TNULL
+        node = self.root
+        while node is not TNULL:
+            leftSize = node.left.size
+            if index < leftSize:
+                node = node.left
+            elif index == leftSize:
+                return node.data, node.value
+            else:
+                index -= leftSize + 1
+                node = node.right
+        return None
+
+    def __len__(self):
+        return self.root.size
+
+    # A function to measure the number of levels in the tree, walking it one level at a time
+    def height(self):
+        TNULL = self.TNULL
+        level = [self.root] if self.root is not TNULL else []
+        height = 0
+        while level:
+            height += 1
+            level = [child for node in level for child in (node.left, node.right) if child is not TNULL]
+        return height
+
     # A function to find the minimum node in the tree
     def minimum(self, node):
         while node.left != self.TNULL:
@@ -316,6 +669,8 @@ class RedBlackTree():
 
     # A function to perform a left-right rotation at node x
     def lrRotation(self, x):
+        if self.stats is not None:
+            self.stats.lrRotations += 1
         y = x.right   # y is the right child of x
         x.right = y.left  # x's right child becomes y's left child
         # Update the parent of y's left child to be x
@@ -333,9 +688,14 @@ class RedBlackTree():
 
         y.left = x  # Make x the left child of y
         x.parent = y  # Update x's parent to be y
+        # y now roots the subtree x used to root, x keeps its left child and y's old left child
+        y.size = x.size
+        x.size = x.left.size + x.right.size + 1
 
     # A function to perform a right-left rotation at node x
     def rlRotate(self, x):
+        if self.stats is not None:
+            self.stats.rlRotations += 1
         y = x.left   # y is the left child of x
         x.left = y.right  # x's left child becomes y's right child
 
@@ -356,13 +716,17 @@ class RedBlackTree():
 
         y.right = x  # Make x the right child of y
         x.parent = y  # Update x's parent to be y
+        # y now roots the subtree x used to root, x keeps its right child and y's old right child
+        y.size = x.size
+        x.size = x.left.size + x.right.size + 1
 
 
-    def insert(self, key):
+    def insert(self, key, value=None):
         # Create a new node with the given key and initialize its attributes
         node = Node(key)
         node.parent = None
         node.data = key
+        node.value = value
         node.left = self.TNULL
         node.right = self.TNULL
         node.color = 1
@@ -372,6 +736,7 @@ class RedBlackTree():
         x = self.root
         while x != self.TNULL:
             y = x
+            x.size += 1  # the new node ends up in the subtree of every node on the path
             if node.data < x.data:
                 x = x.left
             elif node.data > x.data:
@@ -391,16 +756,45 @@ class RedBlackTree():
         # If the parent of the new node is None, it is the root of the tree and its color should be black
         if node.parent == None:
             node.color = 0
-            return
+            return node
         
         # If the grandparent of the new node is None, the tree is still a valid RB tree
         if node.parent.parent == None:
-            return
+            return node
         
         # Perform the necessary rotations and color changes to maintain the RB tree properties
         self.insertRotationHelper(node)
+        return node
 
 
+    # Build the tree from (key, value) pairs sorted by unique key in linear time, returning the nodes in key order.
+    # Every node takes the median of its range, so only the last level can be incomplete; coloring that level red
+    # and everything above it black gives every path the same black height.
+    def bulkLoad(self, items):
+        if self.root != self.TNULL:
+            raise ValueError("bulkLoad needs an empty tree")
+        TNULL = self.TNULL
+        nodes = [None] * len(items)
+        # depth of the incomplete last level, no node reaches it when the tree is perfect
+        redDepth = (len(items) + 1).bit_length() - 1
+
+        def build(lo, hi, parent, depth):
+            if lo > hi:
+                return TNULL
+            mid = (lo + hi) // 2
+            node = Node(items[mid][0])
+            node.value = items[mid][1]
+            node.parent = parent
+            node.size = hi - lo + 1
+            node.color = 1 if depth == redDepth else 0
+            node.left = build(lo, mid - 1, node, depth + 1)
+            node.right = build(mid + 1, hi, node, depth + 1)
+            nodes[mid] = node
+            return node
+
+        self.root = build(0, len(items) - 1, None, 0)
+        return nodes
+
     def get_root(self):
         return self.root
     
@@ -411,148 +805,1924 @@ class RedBlackTree():
         self.__print_helper(self.root, "", True)
 
 
+# class ArrayRedBlackTree is a compact storage backend for the Red Black Tree.
+# Instead of one Node object per ride, the key, children, parent and color of every node live in typed arrays
+# indexed by an integer node handle. Index 0 is the TNULL sentinel and freed slots are reused through a free list.
+class ArrayRedBlackTree():
+    def __init__(self):
+        # Slot 0 is the sentinel node: key 0, black, no children
+        self.data = array('q', [0])
+        self.left = array('q', [0])
+        self.right = array('q', [0])
+        self.parent = array('q', [0])
+        # color of every node (1 for red, 0 for black)
+        self.color = bytearray(1)
+        # number of nodes in the subtree rooted at every node, 0 for the sentinel
+        self.size = array('q', [0])
+        # value stored alongside each key (the Ride record)
+        self.value = [None]
+        # slots released by deletions, reused before the arrays grow
+        self.free = []
+        self.TNULL = 0
+        self.root = 0
+        # optional EngineStats counting rotations and fix-up iterations
+        self.stats = None
+
+    # Allocate a red node for the key, reusing a freed slot when there is one
+    def newNode(self, key, value):
+        if self.free:
+            node = self.free.pop()
+            self.data[node] = key
+            self.left[node] = 0
+            self.right[node] = 0
+            self.parent[node] = 0
+            self.color[node] = 1
+            self.size[node] = 1
+            self.value[node] = value
+            return node
+        self.data.append(key)
+        self.left.append(0)
+        self.right.append(0)
+        self.parent.append(0)
+        self.color.append(1)
+        self.size.append(1)
+        self.value.append(value)
+        return len(self.data) - 1
+
+    # A function to search a node with a given key in the tree, returns TNULL (0) if it is not there
+    def searchTree(self, key):
+        data = self.data
+        left = self.left
+        right = self.right
+        node = self.root
+        while node and data[node] != key:
+            node = left[node] if key < data[node] else right[node]
+        return node
+
+    # A function to count the keys smaller than key in O(log n) using the subtree sizes
+    def countLess(self, key):
+        data = self.data
+        left = self.left
+        right = self.right
+        size = self.size
+        node = self.root
+        count = 0
+        while node:
+            if data[node] < key:
+                count += size[left[node]] + 1
+                node = right[node]
+            else:
+                node = left[node]
+        return count
+
+    # A function to find the (key, value) pair with the given 0-based rank in O(log n), or None if there is none
+    def selectItem(self, index):
+        left = self.left
+        right = self.right
+        size = self.size
+        node = self.root
+        while node:
+            leftSize = size[left[node]]
+            if index < leftSize:
+                node = left[node]
+            elif index == leftSize:
+                return self.data[node], self.value[node]
+            else:
+                index -= leftSize + 1
+                node = right[node]
+        return None
+
+    def __len__(self):
+        return self.size[self.root]
+
+    # A function to measure the number of levels in the tree, walking it one level at a time
+    def height(self):
+        left = self.left
+        right = self.right
+        level = [self.root] if self.root else []
+        height = 0
+        while level:
+            height += 1
+            level = [child for node in level for child in (left[node], right[node]) if child]
+        return height
+
+    # A function to find the minimum node in the subtree rooted at node
+    def minimum(self, node):
+        left = self.left
+        while left[node]:
+            node = left[node]
+        return node
+
+    # A function to perform a left-right rotation at node x
+    def lrRotation(self, x):
+        if self.stats is not None:
+            self.stats.lrRotations += 1
+        left = self.left
+        right = self.right
+        parent = self.parent
+        y = right[x]   # y is the right child of x
+        right[x] = left[y]  # x's right child becomes y's left child
+        if left[y]:
+            parent[left[y]] = x
+        # y takes x's place under x's parent, or becomes the root
+        p = parent[x]
+        parent[y] = p
+        if p == 0:
+            self.root = y
+        elif x == left[p]:
+            left[p] = y
+        else:
+            right[p] = y
+        left[y] = x  # Make x the left child of y
+        parent[x] = y
+        # y now roots the subtree x used to root
+        size = self.size
+        size[y] = size[x]
+        size[x] = size[left[x]] + size[right[x]] + 1
+
+    # A function to perform a right-left rotation at node x
+    def rlRotate(self, x):
+        if self.stats is not None:
+            self.stats.rlRotations += 1
+        left = self.left
+        right = self.right
+        parent = self.parent
+        y = left[x]   # y is the left child of x
+        left[x] = right[y]  # x's left child becomes y's right child
+        if right[y]:
+            parent[right[y]] = x
+        # y takes x's place under x's parent, or becomes the root
+        p = parent[x]
+        parent[y] = p
+        if p == 0:
+            self.root = y
+        elif x == right[p]:
+            right[p] = y
+        else:
+            left[p] = y
+        right[y] = x  # Make x the right child of y
+        parent[x] = y
+        # y now roots the subtree x used to root
+        size = self.size
+        size[y] = size[x]
+        size[x] = size[left[x]] + size[right[x]] + 1
+
+    # Insert the key and return its node handle
+    def insert(self, key, value=None):
+        node = self.newNode(key, value)
+        data = self.data
+        left = self.left
+        right = self.right
+        # Traverse the tree to find the correct position for the new node
+        size = self.size
+        y = 0
+        x = self.root
+        while x:
+            y = x
+            size[x] += 1  # the new node ends up in the subtree of every node on the path
+            x = left[x] if key < data[x] else right[x]
+        self.parent[node] = y
+        if y == 0:
+            # the first node is the root and it is black
+            self.root = node
+            self.color[node] = 0
+            return node
+        if key < data[y]:
+            left[y] = node
+        else:
+            right[y] = node
+        # If the grandparent of the new node is TNULL, the tree is still a valid RB tree
+        if self.parent[y] == 0:
+            return node
+        self.insertRotationHelper(node)
+        return node
+
+    def insertRotationHelper(self, key):
+        left = self.left
+        right = self.right
+        parent = self.parent
+        color = self.color
+        stats = self.stats
+        # While the parent of the current node is red
+        while color[parent[key]] == 1:
+            if stats is not None:
+                stats.insertFixups += 1
+            p = parent[key]
+            g = parent[p]
+            if p == right[g]:
+                uncle = left[g]
+                if color[uncle] == 1:
+                    # case 3.1: both parent and uncle are red, recolor and move up to the grandparent
+                    color[uncle] = 0
+                    color[p] = 0
+                    color[g] = 1
+                    key = g
+                else:
+                    if key == left[p]:
+                        # case 3.2.2: key is a left child
+                        key = p
+                        self.rlRotate(key)
+                    # case 3.2.1: key is a right child
+                    color[parent[key]] = 0
+                    color[parent[parent[key]]] = 1
+                    self.lrRotation(parent[parent[key]])
+            else:
+                uncle = right[g]
+                if color[uncle] == 1:
+                    # mirror case 3.1
+                    color[uncle] = 0
+                    color[p] = 0
+                    color[g] = 1
+                    key = g
+                else:
+                    if key == right[p]:
+                        # mirror case 3.2.2
+                        key = p
+                        self.lrRotation(key)
+                    # mirror case 3.2.1
+                    color[parent[key]] = 0
+                    color[parent[parent[key]]] = 1
+                    self.rlRotate(parent[parent[key]])
+            if key == self.root:
+                break
+        color[self.root] = 0 # set the root to black
+
+    # Helper function to put node two in the place of node one under one's parent
+    def swapNodes(self, one, two):
+        parent = self.parent
+        p = parent[one]
+        if p == 0:
+            self.root = two
+        elif one == self.left[p]:
+            self.left[p] = two
+        else:
+            self.right[p] = two
+        parent[two] = p
+
+    # Delete the node holding key, returns False if the key is not in the tree
+    def deleteNode(self, key):
+        z = self.searchTree(key)
+        if z == 0:
+            return False
+        self.deleteHandle(z)
+        return True
+
+    # Delete the node with the given handle and release its slot
+    def deleteHandle(self, z):
+        left = self.left
+        right = self.right
+        parent = self.parent
+        color = self.color
+        size = self.size
+        # Every subtree that loses a node shrinks by one: the ancestors of z, or of its successor when z has two children
+        node = parent[z] if left[z] == 0 or right[z] == 0 else parent[self.minimum(right[z])]
+        while node:
+            size[node] -= 1
+            node = parent[node]
+        copyColor = color[z]
+        if left[z] == 0:
+            childNode = right[z]
+            self.swapNodes(z, childNode)
+        elif right[z] == 0:
+            childNode = left[z]
+            self.swapNodes(z, childNode)
+        else:
+            # splice the successor of z into its place
+            copy = self.minimum(right[z])
+            copyColor = color[copy]
+            childNode = right[copy]
+            if parent[copy] == z:
+                parent[childNode] = copy
+            else:
+                self.swapNodes(copy, childNode)
+                right[copy] = right[z]
+                parent[right[copy]] = copy
+            self.swapNodes(z, copy)
+            left[copy] = left[z]
+            parent[left[copy]] = copy
+            color[copy] = color[z]
+            size[copy] = size[z]
+        if copyColor == 0:
+            self.deleteRotationHelper(childNode)
+        # drop the value reference and make the slot available again
+        self.value[z] = None
+        self.free.append(z)
+
+    def deleteRotationHelper(self, currNode):
+        left = self.left
+        right = self.right
+        parent = self.parent
+        color = self.color
+        stats = self.stats
+        # Fix the tree after node deletion
+        while currNode != self.root and color[currNode] == 0:
+            if stats is not None:
+                stats.deleteFixups += 1
+            if currNode == left[parent[currNode]]:
+                siblingNode = right[parent[currNode]]
+                # Case 3.1: the sibling is red
+                if color[siblingNode] == 1:
+                    color[siblingNode] = 0
+                    color[parent[currNode]] = 1
+                    self.lrRotation(parent[currNode])
+                    siblingNode = right[parent[currNode]]
+                # Case 3.2: the sibling and its children are black
+                if color[left[siblingNode]] == 0 and color[right[siblingNode]] == 0:
+                    color[siblingNode] = 1
+                    currNode = parent[currNode]
+                else:
+                    # Case 3.3: the sibling's left child is red
+                    if color[right[siblingNode]] == 0:
+                        color[left[siblingNode]] = 0
+                        color[siblingNode] = 1
+                        self.rlRotate(siblingNode)
+                        siblingNode = right[parent[currNode]]
+                    # Case 3.4: the sibling's right child is red
+                    color[siblingNode] = color[parent[currNode]]
+                    color[parent[currNode]] = 0
+                    color[right[siblingNode]] = 0
+                    self.lrRotation(parent[currNode])
+                    currNode = self.root
+            else:
+                siblingNode = left[parent[currNode]]
+                # Case 3.1: the sibling is red
+                if color[siblingNode] == 1:
+                    color[siblingNode] = 0
+                    color[parent[currNode]] = 1
+                    self.rlRotate(parent[currNode])
+                    siblingNode = left[parent[currNode]]
+                # Case 3.2: the sibling and its children are black
+                if color[left[siblingNode]] == 0 and color[right[siblingNode]] == 0:
+                    color[siblingNode] = 1
+                    currNode = parent[currNode]
+                else:
+                    # Case 3.3: the sibling's right child is red
+                    if color[left[siblingNode]] == 0:
+                        color[right[siblingNode]] = 0
+                        color[siblingNode] = 1
+                        self.lrRotation(siblingNode)
+                        siblingNode = left[parent[currNode]]
+                    # Case 3.4: the sibling's left child is red
+                    color[siblingNode] = color[parent[currNode]]
+                    color[parent[currNode]] = 0
+                    color[left[siblingNode]] = 0
+                    self.rlRotate(parent[currNode])
+                    currNode = self.root
+        color[currNode] = 0
+
+    # A function to yield the node handles with keys in [low, high] in ascending order, skipping subtrees outside the bounds
+    def rangeScan(self, low, high):
+        data = self.data
+        left = self.left
+        right = self.right
+        stack = []
+        node = self.root
+        while stack or node:
+            if node:
+                if data[node] < low:
+                    node = right[node]
+                else:
+                    stack.append(node)
+                    node = left[node]
+            else:
+                node = stack.pop()
+                if data[node] > high:
+                    return
+                yield node
+                node = right[node]
+
+    # A function to yield the (key, value) pairs with keys in [low, high] in ascending order
+    def rangeItems(self, low, high):
+        data = self.data
+        value = self.value
+        for node in self.rangeScan(low, high):
+            yield data[node], value[node]
+
+    # Build the tree from (key, value) pairs sorted by unique key in linear time, returning the node handles in key order.
+    # Nodes are allocated in key order, so handle i + 1 holds the i-th key.
+    def bulkLoad(self, items):
+        if self.root:
+            raise ValueError("bulkLoad needs an empty tree")
+        n = len(items)
+        self.data = array('q', [0])
+        self.data.extend(key for key, _ in items)
+        self.value = [None]
+        self.value.extend(value for _, value in items)
+        self.left = array('q', bytes(8 * (n + 1)))
+        self.right = array('q', bytes(8 * (n + 1)))
+        self.parent = array('q', bytes(8 * (n + 1)))
+        self.color = bytearray(n + 1)
+        self.size = array('q', bytes(8 * (n + 1)))
+        self.free = []
+        left = self.left
+        right = self.right
+        parent = self.parent
+        color = self.color
+        size = self.size
+        # depth of the incomplete last level, see RedBlackTree.bulkLoad
+        redDepth = (n + 1).bit_length() - 1
+
+        def build(lo, hi, p, depth):
+            if lo > hi:
+                return 0
+            mid = (lo + hi) // 2
+            node = mid + 1
+            parent[node] = p
+            size[node] = hi - lo + 1
+            if depth == redDepth:
+                color[node] = 1
+            left[node] = build(lo, mid - 1, node, depth + 1)
+            right[node] = build(mid + 1, hi, node, depth + 1)
+            return node
+
+        self.root = build(0, n - 1, 0, 0)
+        return list(range(1, n + 1))
+
+    def get_root(self):
+        return self.root
+
+    def delete_node(self, data):
+        self.deleteNode(data)
+
+
+
+
+
+# RIDE HISTORY
+# A persistent left-leaning Red Black Tree keeps past versions of the board readable. A node never changes once it is
+# built: insert and delete copy the O(log n) nodes on the path they touch and share everything else with the version
+# before, so keeping a version costs no more than keeping its root. The values are immutable (rideCost, tripDuration,
+# deadline, pickup, arrival) tuples, so an old version still shows every ride as it was then, and it can be read by
+# any thread while the live board moves on.
+class PersistentNode:
+    __slots__ = ("key", "value", "left", "right", "red")
+
+    def __init__(self, key, value, left, right, red):
+        self.key = key
+        self.value = value
+        self.left = left
+        self.right = right
+        self.red = red
+
+# One version of the tree. insert and delete return the next version and leave this one as it is.
+class PersistentRedBlackTree:
+    def __init__(self, root=None, size=0):
+        self.root = root
+        self.size = size
+
+    def get(self, key):
+        node = self.root
+        while node is not None:
+            if key < node.key:
+                node = node.left
+            elif key > node.key:
+                node = node.right
+            else:
+                return node.value
+        return None
+
+    def insert(self, key, value):
+        size = self.size + 1 if self.get(key) is None else self.size
+        root = self.put(self.root, key, value)
+        return PersistentRedBlackTree(self.recolor(root, False), size)
+
+    def delete(self, key):
+        if self.get(key) is None:
+            return self
+        root = self.root
+        # start with a red root so the walk down can always borrow a red link
+        if not self.isRed(root.left) and not self.isRed(root.right):
+            root = self.recolor(root, True)
+        root = self.remove(root, key)
+        return PersistentRedBlackTree(None if root is None else self.recolor(root, False), self.size - 1)
+
+    # (key, value) of every node with low <= key <= high, in ascending order
+    def rangeItems(self, low, high):
+        stack = []
+        node = self.root
+        while stack or node is not None:
+            if node is not None:
+                if node.key >= low:
+                    stack.append(node)
+                    node = node.left
+                else:
+                    node = node.right
+            else:
+                node = stack.pop()
+                if node.key > high:
+                    return
+                yield node.key, node.value
+                node = node.right
+
+    # The helpers below build new nodes and never modify the ones they are given
+    def isRed(self, node):
+        return node is not None and node.red
+
+    def recolor(self, node, red):
+        return node if node.red == red else PersistentNode(node.key, node.value, node.left, node.right, red)
+
+    def rotateLeft(self, h):
+        x = h.right
+        return PersistentNode(x.key, x.value, PersistentNode(h.key, h.value, h.left, x.left, True), x.right, h.red)
+
+    def rotateRight(self, h):
+        x = h.left
+        return PersistentNode(x.key, x.value, x.left, PersistentNode(h.key, h.value, x.right, h.right, True), h.red)
+
+    def flipColors(self, h):
+        return PersistentNode(h.key, h.value, self.recolor(h.left, not h.left.red), self.recolor(h.right, not h.right.red), not h.red)
+
+    def balance(self, h):
+        if self.isRed(h.right) and not self.isRed(h.left):
+            h = self.rotateLeft(h)
+        if self.isRed(h.left) and self.isRed(h.left.left):
+            h = self.rotateRight(h)
+        if self.isRed(h.left) and self.isRed(h.right):
+            h = self.flipColors(h)
+        return h
+
+    def put(self, h, key, value):
+        if h is None:
+            return PersistentNode(key, value, None, None, True)
+        if key < h.key:
+            h = PersistentNode(h.key, h.value, self.put(h.left, key, value), h.right, h.red)
+        elif key > h.key:
+            h = PersistentNode(h.key, h.value, h.left, self.put(h.right, key, value), h.red)
+        else:
+            return PersistentNode(key, value, h.left, h.right, h.red)
+        return self.balance(h)
+
+    def moveRedLeft(self, h):
+        h = self.flipColors(h)
+        if self.isRed(h.right.left):
+            h = PersistentNode(h.key, h.value, h.left, self.rotateRight(h.right), h.red)
+            h = self.flipColors(self.rotateLeft(h))
+        return h
+
+    def moveRedRight(self, h):
+        h = self.flipColors(h)
+        if self.isRed(h.left.left):
+            h = self.flipColors(self.rotateRight(h))
+        return h
+
+    def removeMin(self, h):
+        if h.left is None:
+            return None
+        if not self.isRed(h.left) and not self.isRed(h.left.left):
+            h = self.moveRedLeft(h)
+        return self.balance(PersistentNode(h.key, h.value, self.removeMin(h.left), h.right, h.red))
+
+    # Remove key, which has to be in the subtree of h
+    def remove(self, h, key):
+        if key < h.key:
+            if not self.isRed(h.left) and not self.isRed(h.left.left):
+                h = self.moveRedLeft(h)
+            h = PersistentNode(h.key, h.value, self.remove(h.left, key), h.right, h.red)
+        else:
+            if self.isRed(h.left):
+                h = self.rotateRight(h)
+            if key == h.key and h.right is None:
+                return None
+            if not self.isRed(h.right) and not self.isRed(h.right.left):
+                h = self.moveRedRight(h)
+            if key == h.key:
+                # the successor takes the place of the removed node
+                successor = h.right
+                while successor.left is not None:
+                    successor = successor.left
+                h = PersistentNode(successor.key, successor.value, h.left, self.removeMin(h.right), h.red)
+            else:
+                h = PersistentNode(h.key, h.value, h.left, self.remove(h.right, key), h.red)
+        return self.balance(h)
+
+# The versions of the board over the last `retain` mutations. Version v is the board right after mutation number v,
+# the numbering the write-ahead log and snapshots use. Only mutations that change a ride add an entry, a version
+# in between is answered by the entry before it.
+class RideHistory:
+    def __init__(self, retain, tree=None, version=0):
+        self.retain = retain
+        self.tree = tree if tree is not None else PersistentRedBlackTree()
+        # mutation numbers at which the tree changed, ascending, with the tree as of each; entries before head
+        # have been retired and are cut off in bulk
+        self.versions = [version]
+        self.trees = [self.tree]
+        self.head = 0
+
+    # Bring the current tree in line with one ride, None if the ride is no longer on the board
+    def sync(self, rideNumber, ride):
+        tree = self.tree
+        current = tree.get(rideNumber)
+        if ride is None:
+            if current is not None:
+                self.tree = tree.delete(rideNumber)
+        else:
+            value = (ride.rideCost, ride.tripDuration, ride.deadline, ride.pickup, ride.arrival)
+            if current != value:
+                self.tree = tree.insert(rideNumber, value)
+
+    # Publish the current tree as version `version` and retire the versions that fell out of the window
+    def commit(self, version):
+        if self.tree is self.trees[-1]:
+            return
+        if self.versions[-1] == version:
+            self.trees[-1] = self.tree
+        else:
+            self.versions.append(version)
+            self.trees.append(self.tree)
+        versions = self.versions
+        # the newest entry at or before the start of the window is still needed to answer for it
+        while self.head + 1 < len(versions) and versions[self.head + 1] <= version - self.retain:
+            self.head += 1
+        if self.head > len(versions) // 2:
+            del versions[:self.head]
+            del self.trees[:self.head]
+            self.head = 0
+
+    # The tree as of version, or None if that version is older than the retained ones
+    def at(self, version):
+        index = bisect.bisect_right(self.versions, version, self.head) - 1
+        if index < self.head:
+            return None
+        return self.trees[index]
 
 
 
+# RIDE EXPIRY
+# A hierarchical timing wheel: level L has 64 slots, each covering 64^L ticks. A ride is filed at the level of the
+# highest bit in which its deadline differs from the current tick, so scheduling and cancelling are O(1) dict
+# operations. When the clock crosses the start of a higher level slot, that slot's rides are filed again one level
+# down until they reach level 0, whose slots expire. Deadlines beyond the top level wait in an overflow slot.
+WHEEL_BITS = 6
+WHEEL_SLOTS = 1 << WHEEL_BITS
+WHEEL_LEVELS = 6
+
+# A wheel slot: the rides filed in it by rideNumber, plus where to account for them so a ride can leave its slot
+# without a reference to the wheel
+class TimerSlot(dict):
+    __slots__ = ("counts", "level")
+
+    def __init__(self, counts, level):
+        dict.__init__(self)
+        self.counts = counts
+        self.level = level
+
+# Take the ride out of its wheel slot, if it has one
+def cancelTimer(ride):
+    slot = ride.timerSlot
+    if slot is not None:
+        del slot[ride.rideNumber]
+        slot.counts[slot.level] -= 1
+        ride.timerSlot = None
+
+class TimingWheel:
+    def __init__(self, now=0, wallClock=False, tickSeconds=0.001):
+        self.now = now
+        # rides filed per level, the last entry counts the overflow slot
+        self.counts = [0] * (WHEEL_LEVELS + 1)
+        self.wheels = [[TimerSlot(self.counts, level) for _ in range(WHEEL_SLOTS)] for level in range(WHEEL_LEVELS)]
+        self.overflow = TimerSlot(self.counts, WHEEL_LEVELS)
+        # in wall clock mode one tick is tickSeconds of real time since the wheel was created
+        self.wallClock = wallClock
+        self.tickSeconds = tickSeconds
+        self.started = time.monotonic() - now * tickSeconds
+
+    def wallTime(self):
+        return int((time.monotonic() - self.started) / self.tickSeconds)
+
+    # File the ride under its deadline, which has to be later than the current tick
+    def schedule(self, ride, deadline):
+        ride.deadline = deadline
+        self.file(ride)
+
+    def file(self, ride):
+        level = ((ride.deadline ^ self.now).bit_length() - 1) // WHEEL_BITS if ride.deadline != self.now else 0
+        if level >= WHEEL_LEVELS:
+            slot = self.overflow
+        else:
+            slot = self.wheels[level][(ride.deadline >> (WHEEL_BITS * level)) & (WHEEL_SLOTS - 1)]
+        slot[ride.rideNumber] = ride
+        self.counts[slot.level] += 1
+        ride.timerSlot = slot
+
+    # Empty a slot and return its rides
+    def drain(self, slot):
+        rides = list(slot.values())
+        self.counts[slot.level] -= len(rides)
+        slot.clear()
+        for ride in rides:
+            ride.timerSlot = None
+        return rides
+
+    # Move the clock forward to tick t and return the rides whose deadline has passed.
+    # Stretches where the lower levels are empty are skipped in one step, so a long jump only stops at the slot
+    # boundaries of levels that actually hold rides.
+    def advance(self, t):
+        expired = []
+        counts = self.counts
+        wheel0 = self.wheels[0]
+        mask0 = WHEEL_SLOTS - 1
+        while self.now < t:
+            now = self.now
+            if not any(counts):
+                self.now = t
+                break
+            # the lowest level holding rides decides how far the clock can move before something happens
+            level = 0
+            while not counts[level]:
+                level += 1
+            blockEnd = now | ((1 << (WHEEL_BITS * level)) - 1) if level else now | mask0
+            end = min(t, blockEnd)
+            if level == 0:
+                for tick in range(now + 1, end + 1):
+                    slot = wheel0[tick & mask0]
+                    if slot:
+                        expired.extend(self.drain(slot))
+            self.now = end
+            if end == t:
+                break
+            # cross into the next block: refile the higher level slots starting here, top level first
+            self.now = boundary = blockEnd + 1
+            if boundary & ((1 << (WHEEL_BITS * WHEEL_LEVELS)) - 1) == 0:
+                for ride in self.drain(self.overflow):
+                    self.file(ride)
+            for level in range(WHEEL_LEVELS - 1, 0, -1):
+                if boundary & ((1 << (WHEEL_BITS * level)) - 1) == 0:
+                    for ride in self.drain(self.wheels[level][(boundary >> (WHEEL_BITS * level)) & mask0]):
+                        self.file(ride)
+            slot = wheel0[boundary & mask0]
+            if slot:
+                expired.extend(self.drain(slot))
+        return expired
+
+
+# PICKUP INDEX
+# Rides inserted with pickup coordinates are also filed in a uniform grid: cells maps (x // cellSize, y // cellSize) to
+# the rides picked up in that square by rideNumber. A ride keeps its cell as a handle, so it leaves the index in O(1)
+# without a reference to the grid, and a nearby search only visits the cells its radius overlaps.
+GRID_CELL_SIZE = 1000
+
+def unindexRide(ride):
+    cell = ride.cell
+    if cell is not None:
+        del cell[ride.rideNumber]
+        ride.cell = None
+
+class PickupGrid:
+    def __init__(self, cellSize=GRID_CELL_SIZE):
+        self.cellSize = cellSize
+        self.cells = {}
+
+    def add(self, ride, x, y):
+        ride.pickup = (x, y)
+        key = (x // self.cellSize, y // self.cellSize)
+        cell = self.cells.get(key)
+        if cell is None:
+            cell = self.cells[key] = {}
+        cell[ride.rideNumber] = ride
+        ride.cell = cell
+
+    # The ride with the smallest priority key whose pickup lies within radius of (x, y), or None
+    def nearest(self, x, y, radius, priority):
+        # a negative radius reaches no pickup point, even though its square is positive
+        if radius < 0:
+            return None
+        size = self.cellSize
+        lowX, highX = (x - radius) // size, (x + radius) // size
+        lowY, highY = (y - radius) // size, (y + radius) // size
+        cells = self.cells
+        # a radius covering more cells than are occupied is cheaper to answer by walking the occupied ones
+        if (highX - lowX + 1) * (highY - lowY + 1) <= len(cells):
+            keys = [(cx, cy) for cx in range(lowX, highX + 1) for cy in range(lowY, highY + 1) if (cx, cy) in cells]
+        else:
+            keys = [(cx, cy) for cx, cy in cells if lowX <= cx <= highX and lowY <= cy <= highY]
+        best = None
+        bestKey = None
+        reach = radius * radius
+        for key in keys:
+            cell = cells[key]
+            # cells emptied by cancels and pickups are dropped the next time a search passes by
+            if not cell:
+                del cells[key]
+                continue
+            for ride in cell.values():
+                dx = ride.pickup[0] - x
+                dy = ride.pickup[1] - y
+                if dx * dx + dy * dy <= reach:
+                    rideKey = priority(ride)
+                    if best is None or rideKey < bestKey:
+                        best = ride
+                        bestKey = rideKey
+        return best
+
+
 # GATOR TAXI FUNCTIONS
+# bounds of a signed 64 bit rideNumber, used to scan the whole tree
+MIN_RIDE_NUMBER = -(1 << 63)
+MAX_RIDE_NUMBER = (1 << 63) - 1
+
+# keyValueDict maps every active rideNumber to its Ride record, the record links to its tree node and heap slot
 def insertRide(redBlackTree,minHeap,keyValueDict,rideNumber,rideCost,tripDuration):
-    try:
-        #if there is alreqdy a ride with the same rideNumber return 0 to help terminate the program.
-        x=keyValueDict[rideNumber]
+    #if there is alreqdy a ride with the same rideNumber return 0 to help terminate the program.
+    if rideNumber in keyValueDict:
         return 0
-    except:
-        keyValueDict[rideNumber]=[rideCost,tripDuration]
-        redBlackTree.insert(rideNumber)
-        minHeap.insert(Ride(rideNumber,rideCost,tripDuration))
-        return 1
+    ride = Ride(rideNumber,rideCost,tripDuration)
+    keyValueDict[rideNumber]=ride
+    # the tree node keeps the record so range scans never have to look the ride up again
+    ride.node = redBlackTree.insert(rideNumber,ride)
+    minHeap.insert(ride)
+    return 1
 def printRide(redBlackTree,minHeap,keyValueDict,rideNumber):
-    try:#try to find the node with the exact rideNumber and stop executing if the node reaches a null] 
-        # we can also directly print from the dictionary the value of the rideNumber , rideCost, tripDuration
-        return [rideNumber,keyValueDict[rideNumber][0],keyValueDict[rideNumber][1]]
-    except:
+    # print directly from the dictionary the value of the rideNumber , rideCost, tripDuration
+    ride = keyValueDict.get(rideNumber)
+    if ride is None:
         return [0,0,0]
-def printRides(root,minHeap,keyValueDict,x,rideNumber1,rideNumber2):
-    try:#find the values lying in the range and ignore the Null nodes
-        printRides(root.left,minHeap,keyValueDict,x,rideNumber1,rideNumber2)
-        if root.data >= rideNumber1 and root.data <= rideNumber2:
-            x.append([root.data,keyValueDict[root.data][0],keyValueDict[root.data][1]])
-        else:
-            pass
-        printRides(root.right,minHeap,keyValueDict,x,rideNumber1,rideNumber2)
-    except:
-        pass
+    return [rideNumber,ride.rideCost,ride.tripDuration]
+def printRides(redBlackTree,rideNumber1,rideNumber2):
+    # lazily yield the (rideNumber, rideCost, tripDuration) of every ride lying in the range, in ascending order
+    for rideNumber,ride in redBlackTree.rangeItems(rideNumber1,rideNumber2):
+        yield (rideNumber,ride.rideCost,ride.tripDuration)
 def getNextRide(redBlackTree, minHeap, keyValueDict):
     # extract min from the top of the minHeap
-    x = minHeap.extract_min()
-    try: #if the min heap is empty print that there are no active ride requests
-        p = x.rideNumber
-        redBlackTree.delete_node(p)
-        keyValueDict.pop(p)
-        return [x.rideNumber,x.rideCost,x.tripDuration]
-    except:
+    ride = minHeap.extract_min()
+    #if the min heap is empty print that there are no active ride requests
+    if ride is None:
         return "No active ride requests"
+    redBlackTree.deleteHandle(ride.node)
+    del keyValueDict[ride.rideNumber]
+    cancelTimer(ride)
+    unindexRide(ride)
+    return [ride.rideNumber,ride.rideCost,ride.tripDuration]
+
+# Once a batch removes at least this fraction of the tree, rebuilding the rest in O(n) beats deleting node by node
+BULK_DELETE_FRACTION = 0.25
+
+def getNextRides(redBlackTree, minHeap, keyValueDict, k):
+    # extract the k cheapest rides in one go, returns their [rideNumber, rideCost, tripDuration] in order
+    rides = []
+    while len(rides) < k:
+        ride = minHeap.extract_min()
+        if ride is None:
+            break
+        del keyValueDict[ride.rideNumber]
+        cancelTimer(ride)
+        unindexRide(ride)
+        rides.append(ride)
+    if len(rides) >= BULK_DELETE_FRACTION * (len(keyValueDict) + len(rides)):
+        # rebuild the tree from the rides left in the dictionary; a range scan would miss rideNumbers outside 64 bits,
+        # which the Node tree takes like any other
+        remaining = sorted(keyValueDict.items())
+        redBlackTree.root = redBlackTree.TNULL
+        for (_, ride), node in zip(remaining, redBlackTree.bulkLoad(remaining)):
+            ride.node = node
+    else:
+        for ride in rides:
+            redBlackTree.deleteHandle(ride.node)
+    return [[ride.rideNumber, ride.rideCost, ride.tripDuration] for ride in rides]
+
+def peekNextRides(minHeap, k):
+    # the [rideNumber, rideCost, tripDuration] of the k cheapest rides, in order, leaving the board untouched
+    return [[ride.rideNumber, ride.rideCost, ride.tripDuration] for ride in minHeap.peekSmallest(k)]
+
+# Order statistics over rideNumbers, all answered from the subtree sizes kept in the tree
+def countRides(redBlackTree, rideNumber1, rideNumber2):
+    # number of rides in [rideNumber1, rideNumber2]
+    if rideNumber1 > rideNumber2:
+        return 0
+    return redBlackTree.countLess(rideNumber2 + 1) - redBlackTree.countLess(rideNumber1)
+
+def rankRide(redBlackTree, keyValueDict, rideNumber):
+    # 1-based position of the ride in rideNumber order, 0 if there is no such ride
+    if rideNumber not in keyValueDict:
+        return 0
+    return redBlackTree.countLess(rideNumber) + 1
+
+def selectRide(redBlackTree, index):
+    # the [rideNumber, rideCost, tripDuration] of the ride with 1-based rank index, [0,0,0] if there is none
+    item = redBlackTree.selectItem(index - 1) if index >= 1 else None
+    if item is None:
+        return [0,0,0]
+    return [item[0], item[1].rideCost, item[1].tripDuration]
+
+def printPage(redBlackTree, rideNumber1, rideNumber2, offset, limit):
+    # up to limit rides of the range, skipping the first offset of them: one select finds the first ride of the page
+    # and the range scan continues from there, so a page costs O(log n + limit)
+    if rideNumber1 > rideNumber2 or offset < 0 or limit <= 0:
+        return []
+    item = redBlackTree.selectItem(redBlackTree.countLess(rideNumber1) + offset)
+    if item is None or item[0] > rideNumber2:
+        return []
+    page = itertools.islice(redBlackTree.rangeItems(item[0], rideNumber2), limit)
+    return [(rideNumber, ride.rideCost, ride.tripDuration) for rideNumber, ride in page]
+
+def removeRide(redBlackTree,minHeap,keyValueDict,ride):
+    #delete the ride from the redBlackTree, heap, expiry wheel and pickup index through its handles and update the dictionary
+    del keyValueDict[ride.rideNumber]
+    redBlackTree.deleteHandle(ride.node)
+    minHeap.delete(ride)
+    cancelTimer(ride)
+    unindexRide(ride)
 
 def cancelRide(redBlackTree,minHeap,keyValueDict,rideNumber):
     #find the ride Number and do nothing if the rideNumber doesnt exist
-    try:
-        #delete the ride from the redBlackTree and heap and update the dictionary accordingly
-        redBlackTree.delete_node(rideNumber)
-        minHeap.delete(Ride(rideNumber,keyValueDict[rideNumber][0],keyValueDict[rideNumber][1]))
-        keyValueDict.pop(rideNumber)
-    except:
-        pass
+    ride = keyValueDict.get(rideNumber)
+    if ride is None:
+        return
+    removeRide(redBlackTree,minHeap,keyValueDict,ride)
 
 def updateRide(redBlackTree,minHeap, keyValueDict, rideNumber, newTD):
-    try:# if the requested rideNumber isnt found just skip the request.
-        x = keyValueDict[rideNumber][1] # get the trip Duration
-        if newTD < x: # if the new_tripDuration <= existing tripDuration, there would be no action needed just update the tripDuration.
-            minHeap.delete(Ride(rideNumber,keyValueDict[rideNumber][0],keyValueDict[rideNumber][1]))
-            minHeap.insert(Ride(rideNumber,keyValueDict[rideNumber][0],newTD))
-            keyValueDict[rideNumber][1]=newTD
-        elif newTD > x and newTD < 2* x: #if the existing_tripDuration < new_tripDuration <= 2*(existing tripDuration), the driver will cancel the existing ride and a new ride request would be created with a penalty of 10 on existing rideCost . We update the entry in the data structure with (rideNumber, rideCost+10, new_tripDuration)
-            minHeap.delete(Ride(rideNumber,keyValueDict[rideNumber][0],keyValueDict[rideNumber][1]))
-            minHeap.insert(Ride(rideNumber,keyValueDict[rideNumber][0]+10,newTD))
-            keyValueDict[rideNumber][0]=keyValueDict[rideNumber][0]+10
-            keyValueDict[rideNumber][1]=newTD
-        elif newTD>2*x: #if the new_tripDuration > 2*(existing tripDuration), the ride would be automatically declined and the ride would be removed from the data structure.
-            minHeap.delete(Ride(rideNumber,keyValueDict[rideNumber][0],keyValueDict[rideNumber][1]))
-            redBlackTree.delete_node(rideNumber)
-            keyValueDict.pop(rideNumber)
+    # if the requested rideNumber isnt found just skip the request.
+    ride = keyValueDict.get(rideNumber)
+    if ride is None:
+        return
+    x = ride.tripDuration # get the trip Duration
+    if newTD < x: # if the new_tripDuration <= existing tripDuration, there would be no action needed just update the tripDuration.
+        minHeap.change_key(ride,ride.rideCost,newTD)
+    elif newTD > x and newTD < 2* x: #if the existing_tripDuration < new_tripDuration <= 2*(existing tripDuration), the driver will cancel the existing ride and a new ride request would be created with a penalty of 10 on existing rideCost . We update the entry in the data structure with (rideNumber, rideCost+10, new_tripDuration)
+        minHeap.change_key(ride,ride.rideCost+10,newTD)
+    elif newTD>2*x: #if the new_tripDuration > 2*(existing tripDuration), the ride would be automatically declined and the ride would be removed from the data structure.
+        removeRide(redBlackTree,minHeap,keyValueDict,ride)
+
+# Batches smaller than this are classified in plain Python, converting them to arrays would cost more
+NUMPY_MIN_BATCH = 256
+# Once a batch changes or removes at least this fraction of the board, one O(n) heap rebuild beats sifting ride by ride
+BULK_REBUILD_FRACTION = 0.5
+
+def classifyUpdates(rides,newDurations):
+    # split UpdateTrip requests on distinct rides into the ones changing the ride, as (ride, newCost, newTD), and the
+    # declined rides, by the same three way rule as updateRide
+    changed = []
+    declined = []
+    if numpy is not None and len(rides) >= NUMPY_MIN_BATCH:
+        try:
+            old = numpy.fromiter((ride.tripDuration for ride in rides), numpy.int64, len(rides))
+            new = numpy.array(newDurations, dtype=numpy.int64)
+            costs = numpy.fromiter((ride.rideCost for ride in rides), numpy.int64, len(rides))
+        except OverflowError:
+            old = None
+        # 2 * old has to fit in 64 bits as well
+        if old is not None and len(old) and numpy.abs(old).max() < (1 << 62) and numpy.abs(costs).max() < (1 << 62):
+            penalty = (new > old) & (new < 2 * old)
+            changes = (new < old) | penalty
+            costs = (costs + 10 * penalty).tolist()
+            newDurations = new.tolist()
+            for i in numpy.flatnonzero(changes).tolist():
+                changed.append((rides[i], costs[i], newDurations[i]))
+            declined = [rides[i] for i in numpy.flatnonzero(new > 2 * old).tolist()]
+            return changed, declined
+    for ride, newTD in zip(rides, newDurations):
+        x = ride.tripDuration
+        if newTD < x:
+            changed.append((ride, ride.rideCost, newTD))
+        elif newTD > x and newTD < 2 * x:
+            changed.append((ride, ride.rideCost + 10, newTD))
+        elif newTD > 2 * x:
+            declined.append(ride)
+    return changed, declined
+
+def updateRides(redBlackTree,minHeap,keyValueDict,rideNumbers,newDurations):
+    # apply many UpdateTrip requests with the same result as calling updateRide on each of them in order.
+    # Requests for different rides commute, so the k-th request of every ride is applied in round k; a batch with
+    # no repeated rideNumber is a single round.
+    if len(set(rideNumbers)) == len(rideNumbers):
+        rounds = [(rideNumbers, newDurations)]
+    else:
+        rounds = []
+        seen = {}
+        for rideNumber, newTD in zip(rideNumbers, newDurations):
+            k = seen.get(rideNumber, 0)
+            seen[rideNumber] = k + 1
+            if k == len(rounds):
+                rounds.append(([], []))
+            rounds[k][0].append(rideNumber)
+            rounds[k][1].append(newTD)
+    for numbers, durations in rounds:
+        rides = []
+        present = []
+        for rideNumber, newTD in zip(numbers, durations):
+            ride = keyValueDict.get(rideNumber)
+            if ride is not None:
+                rides.append(ride)
+                present.append(newTD)
+        changed, declined = classifyUpdates(rides, present)
+        if len(changed) + len(declined) < BULK_REBUILD_FRACTION * len(keyValueDict):
+            for ride, newCost, newTD in changed:
+                minHeap.change_key(ride, newCost, newTD)
+            for ride in declined:
+                removeRide(redBlackTree, minHeap, keyValueDict, ride)
+            continue
+        # a large round rewrites the rides in place and rebuilds the heap once instead of sifting every ride
+        for ride, newCost, newTD in changed:
+            ride.rideCost = newCost
+            ride.tripDuration = newTD
+        for ride in declined:
+            del keyValueDict[ride.rideNumber]
+            redBlackTree.deleteHandle(ride.node)
+            cancelTimer(ride)
+            unindexRide(ride)
+        minHeap.rebuild(list(keyValueDict.values()))
+
+def cancelRides(redBlackTree,minHeap,keyValueDict,rideNumbers):
+    # apply many CancelRide requests, unknown rideNumbers are skipped like cancelRide does
+    rides = []
+    cancelled = set()
+    for rideNumber in rideNumbers:
+        ride = keyValueDict.get(rideNumber)
+        # a repeated rideNumber finds its ride already cancelled
+        if ride is not None and rideNumber not in cancelled:
+            cancelled.add(rideNumber)
+            rides.append(ride)
+    if len(rides) < BULK_REBUILD_FRACTION * len(keyValueDict):
+        for ride in rides:
+            removeRide(redBlackTree, minHeap, keyValueDict, ride)
+        return
+    # the tree still loses its nodes one by one, deleting through a handle is cheaper than rebuilding it
+    for ride in rides:
+        del keyValueDict[ride.rideNumber]
+        redBlackTree.deleteHandle(ride.node)
+        cancelTimer(ride)
+        unindexRide(ride)
+    minHeap.rebuild(list(keyValueDict.values()))
+
+def expireRides(redBlackTree,minHeap,keyValueDict,timingWheel,t):
+    # move the clock to tick t and remove every ride whose deadline has passed, returns the expired rides
+    expired = timingWheel.advance(t)
+    for ride in expired:
+        removeRide(redBlackTree,minHeap,keyValueDict,ride)
+    return expired
+
+def getNextRideNear(redBlackTree,minHeap,keyValueDict,pickupGrid,x,y,radius):
+    # hand out the cheapest ride, by the heap's priority policy, whose pickup lies within radius of (x, y)
+    ride = pickupGrid.nearest(x,y,radius,minHeap.priority)
+    if ride is None:
+        return "No active ride requests"
+    removeRide(redBlackTree,minHeap,keyValueDict,ride)
+    return [ride.rideNumber,ride.rideCost,ride.tripDuration]
+
+def loadRides(redBlackTree,minHeap,keyValueDict,rides):
+    # bulk load an empty board from (rideNumber, rideCost, tripDuration) triplets in O(n) after sorting them:
+    # the tree is built balanced from the sorted keys, the heap is heapified bottom-up and the dictionary filled in one pass
+    if keyValueDict:
+        raise ValueError("loadRides needs an empty ride board")
+    # a fourth field is the arrival a ride had when it was saved, so the oldest first policy keeps its order
+    records = []
+    latest = -1
+    for record in sorted(rides):
+        rideNumber = record[0]
+        if records and records[-1].rideNumber == rideNumber:
+            raise ValueError("Duplicate RideNumber %d" % rideNumber)
+        ride = Ride(rideNumber,record[1],record[2])
+        if len(record) > 3:
+            ride.arrival = record[3]
+            latest = max(latest, record[3])
+        records.append(ride)
+    if latest >= 0:
+        # rides created from now on arrive after every restored one
+        Ride.arrivals = itertools.count(max(next(Ride.arrivals), latest + 1))
+    nodes = redBlackTree.bulkLoad([(ride.rideNumber,ride) for ride in records])
+    for ride,node in zip(records,nodes):
+        ride.node = node
+        keyValueDict[ride.rideNumber] = ride
+    minHeap.heapify(records)
+    return len(records)
+
+
+# INSTRUMENTATION
+# Counters for the hot paths of the tree and the heap plus a latency histogram per command type.
+# The structures only touch them through an `if stats is not None` check, so with stats off they cost one branch.
+class EngineStats:
+    def __init__(self, dumpPath=None, dumpInterval=10.0):
+        self.lrRotations = 0
+        self.rlRotations = 0
+        self.insertFixups = 0
+        self.deleteFixups = 0
+        self.siftUps = 0
+        self.siftUpLevels = 0
+        self.maxSiftUpLevels = 0
+        self.siftDowns = 0
+        self.siftDownLevels = 0
+        self.maxSiftDownLevels = 0
+        # LazyMinHeap only: dead entries popped on the way to a live one and rebuilds triggered by the dead fraction
+        self.heapTombstones = 0
+        self.heapCompactions = 0
+        # command name -> [count, total ns, max ns, counts per power of two bucket of ns]
+        self.commands = {}
+        # optional file the report is rewritten to every dumpInterval seconds
+        self.dumpPath = dumpPath
+        self.dumpInterval = int(dumpInterval * 1e9)
+        self.nextDump = time.perf_counter_ns() + self.dumpInterval
+
+    def siftUp(self, levels):
+        self.siftUps += 1
+        self.siftUpLevels += levels
+        if levels > self.maxSiftUpLevels:
+            self.maxSiftUpLevels = levels
+
+    def siftDown(self, levels):
+        self.siftDowns += 1
+        self.siftDownLevels += levels
+        if levels > self.maxSiftDownLevels:
+            self.maxSiftDownLevels = levels
+
+    def recordCommand(self, name, elapsed):
+        entry = self.commands.get(name)
+        if entry is None:
+            entry = self.commands[name] = [0, 0, 0, [0] * 64]
+        entry[0] += 1
+        entry[1] += elapsed
+        if elapsed > entry[2]:
+            entry[2] = elapsed
+        # bucket b holds the latencies in [2^(b-1), 2^b) ns
+        entry[3][min(elapsed.bit_length(), 63)] += 1
+
+    def commandReport(self):
+        report = {}
+        for name, (count, total, longest, buckets) in self.commands.items():
+            report[name] = {
+                "count": count,
+                "meanNs": total // count,
+                "maxNs": longest,
+                "histogramNs": {"<%d" % (1 << b): n for b, n in enumerate(buckets) if n},
+            }
+        return report
+
+
+# RIDE BOARD
+# The three structures that make up one ride board, with the entry points every front end goes through
+class RideBoard:
+    def __init__(self, compactTree=False, wallClock=False, lazyHeap=False, compactFraction=0.5, priority=costPriority,
+                 gridCellSize=GRID_CELL_SIZE):
+        # the array backed tree trades Node objects for typed arrays to hold many more rides per process
+        self.redBlackTree = ArrayRedBlackTree() if compactTree else RedBlackTree()
+        # the lazy heap turns cancels and updates into O(1) tombstones, paid back by periodic rebuilds
+        self.minHeap = LazyMinHeap(compactFraction, priority) if lazyHeap else MinHeap(priority)
+        self.keyValueDict = dict()
+        # expiry of rides inserted with a TTL, driven by Tick(t) or, in wall clock mode, by real time
+        self.timingWheel = TimingWheel(wallClock=wallClock)
+        # pickup locations of the rides inserted with coordinates, for GetNextRideNear
+        self.pickupGrid = PickupGrid(gridCellSize)
+        # number of mutations applied so far, snapshots record it so a write-ahead log knows where to resume
+        self.sequence = 0
+        # optional WriteAheadLog every mutation is appended to
+        self.wal = None
+        # optional EngineStats, see enableStats
+        self.stats = None
+        # optional RideHistory, see enableHistory
+        self.history = None
+
+    # Start counting rotations, sifts and command latencies, optionally dumping the report to a file periodically
+    def enableStats(self, dumpPath=None, dumpInterval=10.0):
+        self.stats = EngineStats(dumpPath, dumpInterval)
+        self.redBlackTree.stats = self.stats
+        self.minHeap.stats = self.stats
+
+    def statsReport(self):
+        if self.stats is None:
+            return {"enabled": False}
+        stats = self.stats
+        return {
+            "enabled": True,
+            "rides": len(self.keyValueDict),
+            "tree": {
+                "height": self.redBlackTree.height(),
+                "lrRotations": stats.lrRotations,
+                "rlRotations": stats.rlRotations,
+                "insertFixups": stats.insertFixups,
+                "deleteFixups": stats.deleteFixups,
+            },
+            "heap": {
+                "size": len(self.minHeap),
+                "siftUps": stats.siftUps,
+                "siftUpLevels": stats.siftUpLevels,
+                "maxSiftUpLevels": stats.maxSiftUpLevels,
+                "siftDowns": stats.siftDowns,
+                "siftDownLevels": stats.siftDownLevels,
+                "maxSiftDownLevels": stats.maxSiftDownLevels,
+                # each level a sift moves is one swap
+                "swaps": stats.siftUpLevels + stats.siftDownLevels,
+                "tombstonesSkipped": stats.heapTombstones,
+                "compactions": stats.heapCompactions,
+            },
+            "commands": stats.commandReport(),
+        }
+
+    # Rewrite the stats dump file with the current report
+    def dumpStats(self):
+        stats = self.stats
+        tmpPath = stats.dumpPath + ".tmp"
+        with open(tmpPath, "w") as f:
+            json.dump(self.statsReport(), f)
+        os.replace(tmpPath, stats.dumpPath)
+        stats.nextDump = time.perf_counter_ns() + stats.dumpInterval
+
+    # Keep the versions of the board over the last `retain` mutations readable through printRidesAt
+    def enableHistory(self, retain):
+        tree = PersistentRedBlackTree()
+        for rideNumber, ride in sorted(self.keyValueDict.items()):
+            tree = tree.insert(rideNumber, (ride.rideCost, ride.tripDuration, ride.deadline, ride.pickup, ride.arrival))
+        self.history = RideHistory(retain, tree, self.sequence)
+
+    # Bring the history up to date after the last len(rideNumbers) mutations, the i-th of which touched rideNumbers[i].
+    # Each one is committed as its own version, so PrintAt answers the same whether they came one by one or batched.
+    # Only removals may be recorded this way in bulk: the rides are read as they are now, after the whole batch.
+    def recordHistory(self, rideNumbers):
+        history = self.history
+        keyValueDict = self.keyValueDict
+        version = self.sequence - len(rideNumbers)
+        for rideNumber in rideNumbers:
+            history.sync(rideNumber, keyValueDict.get(rideNumber))
+            version += 1
+            history.commit(version)
+
+    # Order GetNextRide by another priority policy from now on, the heap is rebuilt in O(n)
+    def setPriority(self, priority):
+        self.minHeap.setPriority(priority)
+
+    # A positive ttl makes the ride expire ttl ticks from now, an (x, y) pickup makes it visible to nextRideNear
+    def insert(self, rideNumber, rideCost, tripDuration, ttl=0, pickup=None):
+        # the log record is packed before the board changes, so a value the log cannot hold changes nothing
+        if self.wal is not None:
+            if ttl > 0:
+                deadline = self.timingWheel.now + ttl
+                if pickup is None:
+                    record = packRecord(WAL_INSERT_TTL, WAL_OP_INSERT_TTL, rideNumber, rideCost, tripDuration, deadline)
+                else:
+                    record = packRecord(WAL_INSERT_AT_TTL, WAL_OP_INSERT_AT_TTL, rideNumber, rideCost, tripDuration, pickup[0], pickup[1], deadline)
+            elif pickup is None:
+                record = packRecord(WAL_INSERT, WAL_OP_INSERT, rideNumber, rideCost, tripDuration)
+            else:
+                record = packRecord(WAL_INSERT_AT, WAL_OP_INSERT_AT, rideNumber, rideCost, tripDuration, pickup[0], pickup[1])
+        if insertRide(self.redBlackTree, self.minHeap, self.keyValueDict, rideNumber, rideCost, tripDuration) == 0:
+            return 0
+        if ttl > 0:
+            self.timingWheel.schedule(self.keyValueDict[rideNumber], self.timingWheel.now + ttl)
+        if pickup is not None:
+            self.pickupGrid.add(self.keyValueDict[rideNumber], pickup[0], pickup[1])
+        self.sequence += 1
+        if self.wal is not None:
+            self.wal.append(record)
+        if self.history is not None:
+            self.recordHistory((rideNumber,))
+        return 1
+
+    # Move the clock to tick t, expired rides leave the board like cancelled ones
+    def advance(self, t):
+        # the wall clock restarts with the process and moves before every command, so only Tick(t) is logged
+        tick = None
+        if self.wal is not None and t > self.timingWheel.now and not self.timingWheel.wallClock:
+            tick = packRecord(WAL_TICK, WAL_OP_TICK, t)
+        expired = expireRides(self.redBlackTree, self.minHeap, self.keyValueDict, self.timingWheel, t)
+        self.sequence += len(expired)
+        if self.wal is not None:
+            for ride in expired:
+                self.wal.append(WAL_RIDE.pack(WAL_OP_CANCEL, ride.rideNumber))
+            if tick is not None:
+                self.wal.append(tick)
+        if self.history is not None and expired:
+            self.recordHistory([ride.rideNumber for ride in expired])
+        return expired
+
+    def nextRide(self):
+        l = getNextRide(self.redBlackTree, self.minHeap, self.keyValueDict)
+        if l == "No active ride requests":
+            return l
+        self.sequence += 1
+        # the log names the ride that was handed out, so replaying it never depends on heap order
+        if self.wal is not None:
+            self.wal.append(WAL_RIDE.pack(WAL_OP_TAKE, l[0]))
+        if self.history is not None:
+            self.recordHistory((l[0],))
+        return l
+
+    def nextRides(self, k):
+        rides = getNextRides(self.redBlackTree, self.minHeap, self.keyValueDict, k)
+        self.sequence += len(rides)
+        if self.wal is not None:
+            for l in rides:
+                self.wal.append(WAL_RIDE.pack(WAL_OP_TAKE, l[0]))
+        if self.history is not None and rides:
+            self.recordHistory([l[0] for l in rides])
+        return rides
+
+    def peekNextRides(self, k):
+        return peekNextRides(self.minHeap, k)
+
+    def nextRideNear(self, x, y, radius):
+        l = getNextRideNear(self.redBlackTree, self.minHeap, self.keyValueDict, self.pickupGrid, x, y, radius)
+        if l == "No active ride requests":
+            return l
+        self.sequence += 1
+        if self.wal is not None:
+            self.wal.append(WAL_RIDE.pack(WAL_OP_TAKE, l[0]))
+        if self.history is not None:
+            self.recordHistory((l[0],))
+        return l
+
+    # The priority key and [rideNumber, rideCost, tripDuration] of the ride nextRideNear would hand out, or None
+    def nearestRide(self, x, y, radius):
+        ride = self.pickupGrid.nearest(x, y, radius, self.minHeap.priority)
+        if ride is None:
+            return None
+        return (self.minHeap.priority(ride), [ride.rideNumber, ride.rideCost, ride.tripDuration])
+
+    def cancel(self, rideNumber):
+        if self.wal is not None:
+            record = packRecord(WAL_RIDE, WAL_OP_CANCEL, rideNumber)
+        cancelRide(self.redBlackTree, self.minHeap, self.keyValueDict, rideNumber)
+        self.sequence += 1
+        if self.wal is not None:
+            self.wal.append(record)
+        if self.history is not None:
+            self.recordHistory((rideNumber,))
+
+    def update(self, rideNumber, newTD):
+        if self.wal is not None:
+            record = packRecord(WAL_UPDATE, WAL_OP_UPDATE, rideNumber, newTD)
+        updateRide(self.redBlackTree, self.minHeap, self.keyValueDict, rideNumber, newTD)
+        self.sequence += 1
+        if self.wal is not None:
+            self.wal.append(record)
+        if self.history is not None:
+            self.recordHistory((rideNumber,))
+
+    # Many UpdateTrip requests at once, with the same result as calling update on each in order
+    def updateMany(self, rideNumbers, newDurations):
+        if self.history is not None:
+            # a ride updated twice in the batch has a version in between that only the single updates can record
+            for rideNumber, newTD in zip(rideNumbers, newDurations):
+                self.update(rideNumber, newTD)
+            return
+        if self.wal is not None:
+            records = [packRecord(WAL_UPDATE, WAL_OP_UPDATE, rideNumber, newTD) for rideNumber, newTD in zip(rideNumbers, newDurations)]
+        updateRides(self.redBlackTree, self.minHeap, self.keyValueDict, rideNumbers, newDurations)
+        self.sequence += len(rideNumbers)
+        if self.wal is not None:
+            for record in records:
+                self.wal.append(record)
+
+    def cancelMany(self, rideNumbers):
+        if self.wal is not None:
+            records = [packRecord(WAL_RIDE, WAL_OP_CANCEL, rideNumber) for rideNumber in rideNumbers]
+        cancelRides(self.redBlackTree, self.minHeap, self.keyValueDict, rideNumbers)
+        self.sequence += len(rideNumbers)
+        if self.wal is not None:
+            for record in records:
+                self.wal.append(record)
+        if self.history is not None:
+            self.recordHistory(rideNumbers)
+
+    def printRide(self, rideNumber):
+        return printRide(self.redBlackTree, self.minHeap, self.keyValueDict, rideNumber)
+
+    def printRides(self, rideNumber1, rideNumber2):
+        return printRides(self.redBlackTree, rideNumber1, rideNumber2)
+
+    # The PersistentRedBlackTree of the board as of mutation number `version`, None if it is not retained
+    def versionAt(self, version):
+        if self.history is None or version > self.sequence:
+            return None
+        return self.history.at(version)
+
+    # Print(rideNumber1, rideNumber2) as the board stood right after mutation number `version`, None if that version
+    # is not retained
+    def printRidesAt(self, version, rideNumber1, rideNumber2):
+        tree = self.versionAt(version)
+        if tree is None:
+            return None
+        return [(rideNumber, value[0], value[1]) for rideNumber, value in tree.rangeItems(rideNumber1, rideNumber2)]
+
+    def count(self, rideNumber1, rideNumber2):
+        return countRides(self.redBlackTree, rideNumber1, rideNumber2)
+
+    def rank(self, rideNumber):
+        return rankRide(self.redBlackTree, self.keyValueDict, rideNumber)
+
+    def select(self, index):
+        return selectRide(self.redBlackTree, index)
+
+    def printPage(self, rideNumber1, rideNumber2, offset, limit):
+        return printPage(self.redBlackTree, rideNumber1, rideNumber2, offset, limit)
+
+
+# SNAPSHOTS
+# A snapshot file is a little-endian header (magic, format version, record count, board sequence, clock tick) followed
+# by one fixed-width record per active ride, sorted by rideNumber: (rideNumber, rideCost, tripDuration, arrival,
+# deadline, x, y, flags), where the flags tell whether the ride has a deadline and a pickup. Older files still load:
+# version 3 records lack the arrival, version 2 files hold only (rideNumber, rideCost, tripDuration) and no clock.
+# Their rides get new arrivals in rideNumber order.
+SNAPSHOT_MAGIC = b"GTAXISNP"
+SNAPSHOT_VERSION = 4
+SNAPSHOT_HEADER = struct.Struct("<8sIQQ")
+SNAPSHOT_CLOCK = struct.Struct("<q")
+SNAPSHOT_RECORD = struct.Struct("<qqqqqqqB")
+SNAPSHOT_RECORD_V3 = struct.Struct("<qqqqqqB")
+SNAPSHOT_RECORD_V2 = struct.Struct("<qqq")
+SNAPSHOT_DEADLINE = 1
+SNAPSHOT_PICKUP = 2
+
+def save_snapshot(board, path):
+    if board.history is not None:
+        save_version(board.history.tree, board.sequence, board.timingWheel.now, path)
+        return
+    rides = ((rideNumber, ride.rideCost, ride.tripDuration, ride.deadline, ride.pickup, ride.arrival) for rideNumber, ride in board.redBlackTree.rangeItems(MIN_RIDE_NUMBER, MAX_RIDE_NUMBER))
+    write_snapshot(path, len(board.keyValueDict), board.sequence, board.timingWheel.now, rides)
+
+# Save one version kept by a RideHistory. A version never changes, so it can be written out while the live board
+# goes on taking mutations; taking it costs no more than reading the current root.
+def save_version(tree, sequence, now, path):
+    rides = ((rideNumber,) + value for rideNumber, value in tree.rangeItems(MIN_RIDE_NUMBER, MAX_RIDE_NUMBER))
+    write_snapshot(path, tree.size, sequence, now, rides)
+
+def write_snapshot(path, count, sequence, now, rides):
+    # write every active ride in rideNumber order to a temporary file and move it into place once it is on disk,
+    # so a crash never leaves a half written snapshot behind
+    pack = SNAPSHOT_RECORD.pack
+    tmpPath = path + ".tmp"
+    with open(tmpPath, "wb") as f:
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, count, sequence))
+        f.write(SNAPSHOT_CLOCK.pack(now))
+        buf = bytearray()
+        for rideNumber, rideCost, tripDuration, deadline, pickup, arrival in rides:
+            flags = 0
+            if deadline is None:
+                deadline = 0
+            else:
+                flags |= SNAPSHOT_DEADLINE
+            if pickup is None:
+                x = y = 0
+            else:
+                x, y = pickup
+                flags |= SNAPSHOT_PICKUP
+            buf += pack(rideNumber, rideCost, tripDuration, arrival, deadline, x, y, flags)
+            if len(buf) >= CHUNK_SIZE:
+                f.write(buf)
+                buf.clear()
+        f.write(buf)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmpPath, path)
+
+def load_snapshot(board, path):
+    # map the snapshot into memory and bulk load the empty board straight from the records, returns the ride count
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < SNAPSHOT_HEADER.size:
+            raise ValueError("%s is not a GatorTaxi snapshot" % path)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            magic, version, count, sequence = SNAPSHOT_HEADER.unpack_from(mm, 0)
+            if magic != SNAPSHOT_MAGIC or version not in (2, 3, SNAPSHOT_VERSION):
+                raise ValueError("%s is not a GatorTaxi snapshot" % path)
+            if version == 2:
+                offset, record, now = SNAPSHOT_HEADER.size, SNAPSHOT_RECORD_V2, 0
+            else:
+                offset = SNAPSHOT_HEADER.size + SNAPSHOT_CLOCK.size
+                record = SNAPSHOT_RECORD_V3 if version == 3 else SNAPSHOT_RECORD
+                if size < offset:
+                    raise ValueError("%s is truncated" % path)
+                now = SNAPSHOT_CLOCK.unpack_from(mm, SNAPSHOT_HEADER.size)[0]
+            if size != offset + count * record.size:
+                raise ValueError("%s is truncated" % path)
+            view = memoryview(mm)[offset:]
+            records = record.iter_unpack(view)
+            # records with a deadline or a pickup are set aside and applied once the rides exist
+            extras = []
+            rides = records if version == 2 else splitSnapshotRecords(records, extras, version)
+            try:
+                count = loadRides(board.redBlackTree, board.minHeap, board.keyValueDict, rides)
+            finally:
+                # the mapping can only be closed once nothing refers to its buffer
+                del rides, records
+                view.release()
+    board.sequence = sequence
+    # the wheel is empty on a fresh board, start it over at the tick the snapshot was taken
+    wheel = board.timingWheel
+    board.timingWheel = TimingWheel(now, wheel.wallClock, wheel.tickSeconds)
+    for rideNumber, deadline, x, y, flags in extras:
+        ride = board.keyValueDict[rideNumber]
+        if flags & SNAPSHOT_DEADLINE:
+            board.timingWheel.schedule(ride, deadline)
+        if flags & SNAPSHOT_PICKUP:
+            board.pickupGrid.add(ride, x, y)
+    if board.history is not None:
+        # the versions before the snapshot are gone, the history starts over from it
+        board.enableHistory(board.history.retain)
+    return count
+
+# The (rideNumber, rideCost, tripDuration[, arrival]) of every record, collecting (rideNumber, deadline, x, y, flags)
+# of the ones with a deadline or a pickup in extras
+def splitSnapshotRecords(records, extras, version):
+    if version == 3:
+        for record in records:
+            if record[6]:
+                extras.append((record[0],) + record[3:])
+            yield record[:3]
+        return
+    for record in records:
+        if record[7]:
+            extras.append((record[0],) + record[4:])
+        yield record[:4]
+
+
+# WRITE-AHEAD LOG
+# The log starts with a header (magic, format version, base sequence) and continues with frames. Each frame is one
+# group commit: its payload length and crc32 followed by the binary records of every mutation in the group.
+# Record i of the log is mutation number base + i + 1 of the board, so records already in a snapshot are skipped.
+# Clock records are the exception: they are not mutations, do not count, and are always replayed since moving the
+# clock to a tick it has already passed does nothing.
+WAL_MAGIC = b"GTAXIWAL"
+WAL_VERSION = 2
+WAL_HEADER = struct.Struct("<8sIQ")
+WAL_FRAME = struct.Struct("<II")
+WAL_OP_INSERT = 1
+WAL_OP_CANCEL = 2
+WAL_OP_UPDATE = 3
+WAL_OP_TAKE = 4
+WAL_OP_INSERT_AT = 5
+WAL_OP_INSERT_TTL = 6
+WAL_OP_INSERT_AT_TTL = 7
+WAL_OP_TICK = 8
+WAL_INSERT = struct.Struct("<Bqqq")
+WAL_INSERT_AT = struct.Struct("<Bqqqqq")
+# the TTL inserts log the deadline tick, not the TTL, so replay does not depend on when the clock record came
+WAL_INSERT_TTL = struct.Struct("<Bqqqq")
+WAL_INSERT_AT_TTL = struct.Struct("<Bqqqqqq")
+WAL_RIDE = struct.Struct("<Bq")
+WAL_UPDATE = struct.Struct("<Bqq")
+WAL_TICK = struct.Struct("<Bq")
+
+# Pack a log record, turning a value outside the record's 64 bit fields into a ValueError
+def packRecord(record, *fields):
+    try:
+        return record.pack(*fields)
+    except struct.error:
+        raise ValueError("value out of range for the write-ahead log")
+
+class WriteAheadLog:
+    # Mutations are buffered and made durable together: one fsync covers up to maxBatch records, and no record waits
+    # more than maxDelay seconds for the next append to flush it. close() and sync() flush whatever is left.
+    def __init__(self, path, maxBatch=1024, maxDelay=0.005):
+        self.path = path
+        self.maxBatch = maxBatch
+        self.maxDelay = maxDelay
+        self.buffer = bytearray()
+        self.pending = 0
+        self.firstPending = 0.0
+        self.file = None
+
+    # Replay the log on top of the board (normally fresh from load_snapshot), cut off a torn tail and start appending.
+    def open(self, board):
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            end = self.replay(board)
+            self.file = open(self.path, "r+b")
+            self.file.truncate(end)
+            self.file.seek(end)
         else:
-            pass
-    except:
-        pass
-if __name__ == "__main__":
-    redBlackTree = RedBlackTree()
-    minHeap = MinHeap()
-    keyValueDict=dict()
-    fread = open(sys.argv[1],'r')
-    fwrite = open("output_file.txt", 'w')
-    flag = 1
-    while flag:
-        #Reads each line from the file
-        line = fread.readline()
-        #Check if the command says insert
-        if "Insert" in line:
-            cmdArgs = line[7:-2:] #Get the arguements from the command
-            argList = cmdArgs.split(",") # seperate the arguements for the insert command
-            rideNumber=int(argList[0])
-            rideCost = int(argList[1])
-            tripDuration = int(argList[2])
-            flag = insertRide(redBlackTree,minHeap,keyValueDict,rideNumber,rideCost,tripDuration)
-            if flag==0:
-                fwrite.write("Duplicate RideNumber\n")# if rideNumber already exists in the tree terminate the program and print the following
-
-        #Check if the command says GetNextRide
-        if "GetNextRide" in line:
-            #extract the min value in the minHeap and delete that corresponding node in the redBlackTree
-            l = getNextRide(redBlackTree,minHeap,keyValueDict)
-            #if there are no ride requests available print the same
-            if "No active ride requests"==l:
-                fwrite.write(l + "\n")
+            self.file = open(self.path, "wb")
+            self.writeHeader(board.sequence)
+        board.wal = self
+        return self
+
+    def writeHeader(self, sequence):
+        self.file.write(WAL_HEADER.pack(WAL_MAGIC, WAL_VERSION, sequence))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    # Apply every complete frame to the board and return the offset where the valid part of the log ends
+    def replay(self, board):
+        with open(self.path, "rb") as f:
+            data = f.read()
+        if len(data) < WAL_HEADER.size:
+            raise ValueError("%s is not a GatorTaxi write-ahead log" % self.path)
+        magic, version, sequence = WAL_HEADER.unpack_from(data, 0)
+        # version 1 logs only hold the records from before TTLs and clock records were logged
+        if magic != WAL_MAGIC or version not in (1, WAL_VERSION):
+            raise ValueError("%s is not a GatorTaxi write-ahead log" % self.path)
+        if sequence > board.sequence:
+            raise ValueError("%s starts after mutation %d, load a newer snapshot first" % (self.path, board.sequence))
+        offset = WAL_HEADER.size
+        while offset + WAL_FRAME.size <= len(data):
+            length, checksum = WAL_FRAME.unpack_from(data, offset)
+            start = offset + WAL_FRAME.size
+            payload = data[start:start + length]
+            # a short or corrupt frame is a group that never finished its fsync, everything after it is discarded
+            if len(payload) != length or zlib.crc32(payload) != checksum:
+                break
+            sequence = self.applyFrame(board, payload, sequence)
+            offset = start + length
+        return offset
+
+    def applyFrame(self, board, payload, sequence):
+        pos = 0
+        while pos < len(payload):
+            op = payload[pos]
+            if op == WAL_OP_TICK:
+                _, t = WAL_TICK.unpack_from(payload, pos)
+                pos += WAL_TICK.size
+                # the rides this tick expired follow as their own cancel records, so it only moves the clock
+                board.advance(t)
+                continue
+            deadline = 0
+            pickup = None
+            if op == WAL_OP_INSERT:
+                _, rideNumber, rideCost, tripDuration = WAL_INSERT.unpack_from(payload, pos)
+                pos += WAL_INSERT.size
+            elif op == WAL_OP_INSERT_AT:
+                _, rideNumber, rideCost, tripDuration, x, y = WAL_INSERT_AT.unpack_from(payload, pos)
+                pickup = (x, y)
+                pos += WAL_INSERT_AT.size
+            elif op == WAL_OP_INSERT_TTL:
+                _, rideNumber, rideCost, tripDuration, deadline = WAL_INSERT_TTL.unpack_from(payload, pos)
+                pos += WAL_INSERT_TTL.size
+            elif op == WAL_OP_INSERT_AT_TTL:
+                _, rideNumber, rideCost, tripDuration, x, y, deadline = WAL_INSERT_AT_TTL.unpack_from(payload, pos)
+                pickup = (x, y)
+                pos += WAL_INSERT_AT_TTL.size
+            elif op == WAL_OP_UPDATE:
+                _, rideNumber, newTD = WAL_UPDATE.unpack_from(payload, pos)
+                pos += WAL_UPDATE.size
             else:
-                fwrite.write("("+str(l[0])+","+str(l[1])+","+str(l[2])+")\n")
-
-        #Check if the command says Print
-        if "Print" in line:
-            cmdArgs = line[6:-2:]
-            argList = cmdArgs.split(",")
-            #if there is only one arguement in the print command we use the printRide function
-            if len(argList)==1:
-                l=printRide(redBlackTree,minHeap,keyValueDict,int(argList[0]))
-                fwrite.write("("+str(l[0])+","+str(l[1])+","+str(l[2])+")\n")
-            # if there are 2 arguements in the print command we use the printRides function
+                _, rideNumber = WAL_RIDE.unpack_from(payload, pos)
+                pos += WAL_RIDE.size
+            sequence += 1
+            # mutations the board already has (from the snapshot) are skipped
+            if sequence <= board.sequence:
+                continue
+            if op == WAL_OP_INSERT or op == WAL_OP_INSERT_AT or op == WAL_OP_INSERT_TTL or op == WAL_OP_INSERT_AT_TTL:
+                board.insert(rideNumber, rideCost, tripDuration, deadline - board.timingWheel.now if deadline else 0, pickup)
+            elif op == WAL_OP_UPDATE:
+                board.update(rideNumber, newTD)
             else:
-                #get all the rides within the range of the 2 argumements
-                p = []
-                printRides(redBlackTree.root,minHeap,keyValueDict,p,int(argList[0]),int(argList[1]))
-                string = ""
-                #if there are no rides within the range print (0,0,0)
-                if len(p)==0:
-                    fwrite.write("(0,0,0)\n")
-                #print all the rides in a single line
-                else:
-                    #concatenate the rides to a single line as required
-                    for i in p:
-                        string += "("+str(i[0])+","+str(i[1])+","+str(i[2])+")" + ","
-                    fwrite.write(string[:-1] + "\n")
-
-        #Check if the command says UpdateTrip
-        if "UpdateTrip" in line:
-            cmdArgs = line[11:-2:]  #Get the numbers to perform the operation
-            argList = cmdArgs.split(",") #Get the arguements
-            updateRide(redBlackTree,minHeap,keyValueDict,int(argList[0]),int(argList[1]))
-
-        #Check if the command says Cancel
-        if "Cancel" in line:
-            cmdArgs = line[11:-2:] # Get the number
-            argList = cmdArgs.split(',') #get the arguements for which ride to cancel
-            cancelRide(redBlackTree,minHeap,keyValueDict,int(argList[0])) #cancel the ride from the redBlackTree and the minHeap
-
-        #Check if the pointer reached the end of the file
-        if line == "":
-            flag = 0 # change the condition to terminate the group
-    # next iteration / exit loop
-    #close the files
-    fwrite.close() 
-    fread.close()  
+                # a ride handed out by GetNextRide leaves the board exactly like a cancelled one
+                board.cancel(rideNumber)
+        return sequence
+
+    def append(self, record):
+        self.buffer += record
+        self.pending += 1
+        if self.pending == 1:
+            self.firstPending = time.monotonic()
+        # checked on the first record too, so a batch of 1 or a zero delay syncs every record right away
+        if self.pending >= self.maxBatch or time.monotonic() - self.firstPending >= self.maxDelay:
+            self.sync()
+
+    # Write the buffered records as one frame and fsync them
+    def sync(self):
+        if not self.pending:
+            return
+        self.file.write(WAL_FRAME.pack(len(self.buffer), zlib.crc32(self.buffer)))
+        self.file.write(self.buffer)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.buffer.clear()
+        self.pending = 0
+
+    # Save a snapshot of the board and restart the log after it, so the next startup only replays newer mutations.
+    # If the process dies between the two steps the old records are still skipped, the snapshot covers them.
+    def checkpoint(self, board, snapshotPath):
+        self.sync()
+        save_snapshot(board, snapshotPath)
+        self.file.seek(0)
+        self.file.truncate()
+        self.writeHeader(board.sequence)
+
+    def close(self):
+        if self.file is not None:
+            self.sync()
+            self.file.close()
+            self.file = None
+
+
+# COMMAND PIPELINE
+# Size of each read from the input stream; commands are split out of these chunks instead of read line by line
+CHUNK_SIZE = 1 << 20
+
+# Format a (rideNumber, rideCost, tripDuration) triplet the way the output file expects it
+def formatRide(ride):
+    return "(%d,%d,%d)" % (ride[0], ride[1], ride[2])
+
+# Split a command line such as "Insert(1,2,3)" into its name and a tuple of integer arguments
+def parseCommand(line):
+    name, _, rest = line.partition("(")
+    body = rest.rpartition(")")[0] if ")" in rest else rest
+    if body.strip() == "":
+        return name.strip(), ()
+    return name.strip(), tuple(map(int, body.split(",")))
+
+# Every handler receives the board, the parsed arguments and the list that collects output lines.
+# A handler returns 0 when the program has to stop, like insertRide does on a duplicate rideNumber.
+def runInsert(board, args, out):
+    # Insert(rideNumber,rideCost,tripDuration[,ttl]) or Insert(rideNumber,rideCost,tripDuration,x,y[,ttl])
+    try:
+        if len(args) >= 5:
+            result = board.insert(args[0], args[1], args[2], args[5] if len(args) > 5 else 0, (args[3], args[4]))
+        else:
+            result = board.insert(*args)
+    except ValueError as e:
+        # only raised before the board changes, the command is skipped
+        out.append("Error: %s" % e)
+        return
+    if result == 0:
+        out.append("Duplicate RideNumber") # if rideNumber already exists in the tree terminate the program
+        return 0
+
+def runGetNextRide(board, args, out):
+    # GetNextRide(k) hands out the k cheapest rides at once and prints them on a single line
+    if args:
+        if args[0] <= 0:
+            # not to be confused with an empty board
+            out.append("Invalid number of rides")
+            return
+        rides = board.nextRides(args[0])
+        out.append(",".join(map(formatRide, rides)) if rides else "No active ride requests")
+        return
+    l = board.nextRide()
+    out.append(l if l == "No active ride requests" else formatRide(l))
+
+def runGetNextRideNear(board, args, out):
+    # GetNextRideNear(x,y,radius) hands out the cheapest ride picked up within radius of (x, y)
+    l = board.nextRideNear(args[0], args[1], args[2])
+    out.append(l if l == "No active ride requests" else formatRide(l))
+
+def runPeekNextRides(board, args, out):
+    if args[0] <= 0:
+        out.append("Invalid number of rides")
+        return
+    rides = board.peekNextRides(args[0])
+    out.append(",".join(map(formatRide, rides)) if rides else "No active ride requests")
+
+def runPrint(board, args, out):
+    # one arguement prints a single ride, two arguements print every ride within the range
+    if len(args) == 1:
+        out.append(formatRide(board.printRide(args[0])))
+    else:
+        # the rides are formatted as they stream out of the tree, if there are none print (0,0,0)
+        line = ",".join(map(formatRide, board.printRides(args[0], args[1])))
+        out.append(line if line else "(0,0,0)")
+
+def runPrintAt(board, args, out):
+    # PrintAt(version,rideNumber1,rideNumber2) prints like Print(rideNumber1,rideNumber2) as of mutation number version
+    printRidesAt = getattr(board, "printRidesAt", None)
+    rides = None if printRidesAt is None else printRidesAt(args[0], args[1], args[2])
+    if rides is None:
+        out.append("Version not retained")
+        return
+    out.append(",".join(map(formatRide, rides)) if rides else "(0,0,0)")
+
+def runUpdateTrip(board, args, out):
+    try:
+        board.update(args[0], args[1])
+    except ValueError as e:
+        out.append("Error: %s" % e)
+
+def runCancelRide(board, args, out):
+    try:
+        board.cancel(args[0])
+    except ValueError as e:
+        out.append("Error: %s" % e)
+
+def runTick(board, args, out):
+    try:
+        board.advance(args[0])
+    except ValueError as e:
+        out.append("Error: %s" % e)
+
+def runCount(board, args, out):
+    out.append(str(board.count(args[0], args[1])))
+
+def runRank(board, args, out):
+    out.append(str(board.rank(args[0])))
+
+def runSelect(board, args, out):
+    out.append(formatRide(board.select(args[0])))
+
+def runPrintPage(board, args, out):
+    # PrintPage(a,b,offset,limit) prints like Print(a,b) but only limit rides, starting offset rides into the range
+    rides = board.printPage(args[0], args[1], args[2], args[3])
+    out.append(",".join(map(formatRide, rides)) if rides else "(0,0,0)")
+
+def runStats(board, args, out):
+    # boards without instrumentation report {"enabled": false}
+    report = board.statsReport() if getattr(board, "stats", None) is not None else {"enabled": False}
+    out.append(json.dumps(report, separators=(",", ":")))
+
+# Dispatch table from command name to its handler
+COMMANDS = {
+    "Insert": runInsert,
+    "GetNextRide": runGetNextRide,
+    "GetNextRideNear": runGetNextRideNear,
+    "Print": runPrint,
+    "PrintAt": runPrintAt,
+    "UpdateTrip": runUpdateTrip,
+    "CancelRide": runCancelRide,
+    "PeekNextRides": runPeekNextRides,
+    "Count": runCount,
+    "Rank": runRank,
+    "Select": runSelect,
+    "PrintPage": runPrintPage,
+    "Stats": runStats,
+    "Tick": runTick,
+}
+
+# Run every command of the stream against the board, writing the results once per chunk instead of once per line.
+# Returns 0 if a handler stopped the run early and 1 once the whole stream has been processed.
+def processCommands(board, fread, fwrite, chunkSize=CHUNK_SIZE, commands=COMMANDS):
+    stopped = False
+    # with instrumentation on every handler is timed, boards without it (like a sharded one) are not
+    stats = getattr(board, "stats", None)
+    # in wall clock mode expired rides are removed before every command
+    timingWheel = getattr(board, "timingWheel", None)
+    wallClock = timingWheel is not None and timingWheel.wallClock
+    clock = time.perf_counter_ns
+    # with a write-ahead log the results of a chunk are only written once its mutations are durable
+    wal = getattr(board, "wal", None)
+    out = []
+    tail = ""
+    while True:
+        chunk = fread.read(chunkSize)
+        lines = (tail + chunk).split("\n")
+        # the last piece may be a partial line, keep it for the next chunk unless the stream is finished
+        tail = lines.pop() if chunk else ""
+        for line in lines:
+            name, args = parseCommand(line)
+            handler = commands.get(name)
+            if handler is None:
+                continue
+            if wallClock:
+                board.advance(timingWheel.wallTime())
+            if stats is None:
+                result = handler(board, args, out)
+            else:
+                began = clock()
+                result = handler(board, args, out)
+                ended = clock()
+                stats.recordCommand(name, ended - began)
+                if stats.dumpPath is not None and ended >= stats.nextDump:
+                    board.dumpStats()
+            if result == 0:
+                stopped = True
+                break
+        if wal is not None:
+            wal.sync()
+        if out:
+            fwrite.write("\n".join(out) + "\n")
+            out.clear()
+        if stopped:
+            return 0
+        if not chunk:
+            return 1
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay GatorTaxi commands against an in-memory ride board.")
+    parser.add_argument("input", help="file with one command per line, or - to read from stdin")
+    parser.add_argument("output", nargs="?", default="output_file.txt", help="where to write the results, or - for stdout (default: output_file.txt)")
+    parser.add_argument("--compact-tree", action="store_true", help="store the Red Black Tree in typed arrays instead of Node objects")
+    parser.add_argument("--lazy-heap", action="store_true", help="delete and update heap entries lazily through tombstones instead of sifting them")
+    parser.add_argument("--lazy-heap-threshold", type=float, default=0.5, help="fraction of dead heap entries that triggers a rebuild with --lazy-heap (default: 0.5)")
+    parser.add_argument("--priority", choices=sorted(PRIORITY_POLICIES), default="cost", help="order in which GetNextRide hands out rides (default: cost)")
+    parser.add_argument("--surge", type=float, default=1.0, help="surcharge per minute of trip added to the cost by --priority surge (default: 1)")
+    parser.add_argument("--grid-cell", type=int, default=GRID_CELL_SIZE, help="side of the pickup grid cells searched by GetNextRideNear (default: %d)" % GRID_CELL_SIZE)
+    parser.add_argument("--load-snapshot", metavar="PATH", help="start from the rides in a binary snapshot instead of an empty board")
+    parser.add_argument("--save-snapshot", metavar="PATH", help="write the rides left after the last command to a binary snapshot")
+    parser.add_argument("--history", type=int, default=0, help="keep the board as of each of the last N mutations readable by PrintAt (default: 0, off)")
+    parser.add_argument("--wal", metavar="PATH", help="replay this write-ahead log on startup and append every mutation to it")
+    parser.add_argument("--wal-batch", type=int, default=1024, help="most mutations made durable by one fsync (default: 1024)")
+    parser.add_argument("--wal-delay", type=float, default=0.005, help="longest time in seconds a mutation waits for its fsync (default: 0.005)")
+    parser.add_argument("--wall-clock", action="store_true", help="expire rides inserted with a TTL in real time, one tick per millisecond, instead of on Tick(t)")
+    parser.add_argument("--stats", action="store_true", help="count rotations, sifts and command latencies for the Stats() command")
+    parser.add_argument("--stats-file", metavar="PATH", help="also rewrite the stats report to this file periodically (implies --stats)")
+    parser.add_argument("--stats-interval", type=float, default=10.0, help="seconds between two stats dumps (default: 10)")
+    args = parser.parse_args(argv)
+
+    board = RideBoard(compactTree=args.compact_tree, wallClock=args.wall_clock, lazyHeap=args.lazy_heap, compactFraction=args.lazy_heap_threshold,
+                      priority=PRIORITY_POLICIES[args.priority](args.surge), gridCellSize=args.grid_cell)
+    if args.stats or args.stats_file:
+        board.enableStats(args.stats_file, args.stats_interval)
+    if args.history > 0:
+        board.enableHistory(args.history)
+    if args.load_snapshot:
+        load_snapshot(board, args.load_snapshot)
+    wal = None
+    if args.wal:
+        wal = WriteAheadLog(args.wal, args.wal_batch, args.wal_delay).open(board)
+
+    fread = sys.stdin if args.input == "-" else open(args.input, 'r', buffering=CHUNK_SIZE)
+    fwrite = sys.stdout if args.output == "-" else open(args.output, 'w', buffering=CHUNK_SIZE)
+    try:
+        processCommands(board, fread, fwrite)
+    finally:
+        #close the files
+        if fwrite is not sys.stdout:
+            fwrite.close()
+        if fread is not sys.stdin:
+            fread.close()
+    if wal is not None:
+        # with a log the snapshot doubles as a checkpoint that lets the log start over
+        if args.save_snapshot:
+            wal.checkpoint(board, args.save_snapshot)
+        wal.close()
+    elif args.save_snapshot:
+        save_snapshot(board, args.save_snapshot)
+    if args.stats_file:
+        board.dumpStats()
+
+if __name__ == "__main__":
+    main()
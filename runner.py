@@ -0,0 +1,123 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from gatorTaxi import CHUNK_SIZE, PRIORITY_POLICIES, RideBoard, processCommands
+
+# BATCH RUNNER
+# Replays many independent command files, one per city, on a pool of worker processes. Every job gets a fresh
+# RideBoard, so cities never share a tree, heap or index, and writes to its own output file. The interpreter starts
+# once per worker instead of once per file, and the largest files are handed out first so one long city does not
+# keep the pool waiting at the end.
+
+# Counts the command lines processCommands reads through it
+class CountingReader:
+    def __init__(self, f):
+        self.f = f
+        self.lines = 0
+        self.last = ""
+
+    def read(self, size):
+        chunk = self.f.read(size)
+        self.lines += chunk.count("\n")
+        if chunk:
+            self.last = chunk[-1]
+        elif self.last not in ("", "\n"):
+            # a last line without a newline is a command too
+            self.lines += 1
+            self.last = "\n"
+        return chunk
+
+# Run one job in a worker and describe how it went
+def runJob(job):
+    result = {"input": job["input"], "output": job["output"]}
+    began = time.perf_counter()
+    try:
+        board = RideBoard(compactTree=job["compactTree"], lazyHeap=job["lazyHeap"], priority=PRIORITY_POLICIES[job["priority"]](job["surge"]))
+        os.makedirs(os.path.dirname(job["output"]) or ".", exist_ok=True)
+        with open(job["input"], 'r', buffering=CHUNK_SIZE) as f, open(job["output"], 'w', buffering=CHUNK_SIZE) as fwrite:
+            fread = CountingReader(f)
+            finished = processCommands(board, fread, fwrite)
+    except Exception as e:
+        # a bad file only fails its own job, the exception would otherwise abort the whole pool run
+        result["status"] = "error: %s: %s" % (type(e).__name__, e)
+        return result
+    seconds = time.perf_counter() - began
+    # a duplicate rideNumber stops a file early, exactly like gatorTaxi.py
+    result["status"] = "ok" if finished else "stopped"
+    result["commands"] = fread.lines
+    result["seconds"] = seconds
+    result["commandsPerSec"] = fread.lines / seconds if seconds else None
+    return result
+
+# A manifest is a JSON list of {"input": path, "output": path} objects, the output being optional.
+# Relative paths are taken relative to the manifest.
+def readManifest(path):
+    with open(path) as f:
+        entries = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    for entry in entries:
+        output = entry.get("output")
+        jobs.append((os.path.join(base, entry["input"]), None if output is None else os.path.join(base, output)))
+    return jobs
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay many GatorTaxi command files in parallel, each on its own ride board.")
+    parser.add_argument("inputs", nargs="*", help="command files, one per city")
+    parser.add_argument("--manifest", metavar="PATH", help="JSON list of {\"input\": ..., \"output\": ...} jobs, run after the inputs given directly")
+    parser.add_argument("--output-dir", default=".", help="where outputs without an explicit path go, as <input name>.out (default: .)")
+    parser.add_argument("--jobs", type=int, default=multiprocessing.cpu_count(), help="number of worker processes (default: one per core)")
+    parser.add_argument("--compact-tree", action="store_true", help="store the Red Black Trees in typed arrays instead of Node objects")
+    parser.add_argument("--lazy-heap", action="store_true", help="delete and update heap entries lazily through tombstones instead of sifting them")
+    parser.add_argument("--priority", choices=sorted(PRIORITY_POLICIES), default="cost", help="order in which GetNextRide hands out rides (default: cost)")
+    parser.add_argument("--surge", type=float, default=1.0, help="surcharge per minute of trip added to the cost by --priority surge (default: 1)")
+    parser.add_argument("--summary", metavar="PATH", help="write the JSON throughput summary here instead of stdout")
+    args = parser.parse_args(argv)
+
+    paths = [(path, None) for path in args.inputs]
+    if args.manifest:
+        paths.extend(readManifest(args.manifest))
+    if not paths:
+        parser.error("no input files given")
+    jobs = []
+    for index, (inputPath, outputPath) in enumerate(paths):
+        if outputPath is None:
+            outputPath = os.path.join(args.output_dir, os.path.basename(inputPath) + ".out")
+        jobs.append({"index": index, "input": inputPath, "output": outputPath, "compactTree": args.compact_tree,
+                     "lazyHeap": args.lazy_heap, "priority": args.priority, "surge": args.surge})
+    outputs = [os.path.abspath(job["output"]) for job in jobs]
+    if len(set(outputs)) != len(outputs):
+        parser.error("two jobs write to the same output file, give them explicit outputs in a manifest")
+    # largest first, a missing file sorts last and fails in its worker
+    jobs.sort(key=lambda job: os.path.getsize(job["input"]) if os.path.exists(job["input"]) else -1, reverse=True)
+
+    began = time.perf_counter()
+    results = [None] * len(jobs)
+    with multiprocessing.Pool(min(args.jobs, len(jobs))) as pool:
+        # one job per task, so the workers pick them up in size order; the report keeps the order they were given in
+        for job, result in zip(jobs, pool.imap(runJob, jobs, chunksize=1)):
+            results[job["index"]] = result
+    seconds = time.perf_counter() - began
+    commands = sum(result.get("commands", 0) for result in results)
+    summary = {
+        "jobs": results,
+        "workers": min(args.jobs, len(jobs)),
+        "commands": commands,
+        "seconds": seconds,
+        "commandsPerSec": commands / seconds if seconds else None,
+    }
+    text = json.dumps(summary, indent=2)
+    if args.summary:
+        with open(args.summary, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if any(result["status"].startswith("error") for result in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import argparse
+import asyncio
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+from concurrency import ConcurrentBoard
+from gatorTaxi import COMMANDS, PRIORITY_POLICIES, RideBoard, WriteAheadLog, load_snapshot, parseCommand
+
+# LINE PROTOCOL SERVER
+# Clients send the same commands as the input file, one per line, and may pipeline as many as they like.
+# Every command gets exactly one response line, in order: the line the batch program would print, or "OK" for
+# commands that print nothing there. All complete lines of one read are applied together before the event loop
+# moves on, so a pipelined batch never interleaves with another client's commands.
+# With --threads the batches run on a thread pool against a ConcurrentBoard instead: reads from different clients
+# proceed side by side and mutations are applied in order through its writer queue, so batches of different clients
+# interleave command by command.
+
+READ_SIZE = 1 << 16
+# Log records, snapshots and the compact tree hold every value in 64 signed bits, so arguments outside them are
+# refused before they reach the board
+MIN_ARGUMENT = -(1 << 63)
+MAX_ARGUMENT = (1 << 63) - 1
+
+# Apply a batch of raw command lines to the board and return the encoded responses.
+# With a write-ahead log, syncLog makes the batch's records durable before any response can go out.
+def runLines(board, lines, syncLog=None):
+    commands = COMMANDS
+    out = []
+    for raw in lines:
+        try:
+            line = raw.decode()
+        except UnicodeDecodeError:
+            out.append("Error: command is not valid UTF-8")
+            continue
+        if line.strip() == "":
+            continue
+        try:
+            name, args = parseCommand(line)
+        except ValueError:
+            out.append("Error: cannot parse " + line.strip())
+            continue
+        handler = commands.get(name)
+        if handler is None:
+            out.append("Error: unknown command " + name)
+            continue
+        if any(arg < MIN_ARGUMENT or arg > MAX_ARGUMENT for arg in args):
+            out.append("Error: argument out of range for " + name)
+            continue
+        before = len(out)
+        try:
+            # a duplicate insert stops the batch program, here it is only reported
+            handler(board, args, out)
+        except (IndexError, TypeError, ValueError, OverflowError, struct.error):
+            # too few or too many arguments, or a value a 64 bit field cannot take; the rest of the batch still gets
+            # its responses
+            out.append("Error: wrong arguments for " + name)
+            continue
+        if len(out) == before:
+            out.append("OK")
+    if syncLog is not None:
+        syncLog()
+    return ("\n".join(out) + "\n").encode() if out else b""
+
+async def handleClient(board, reader, writer, executor, syncLog=None):
+    loop = asyncio.get_running_loop()
+    tail = b""
+    try:
+        while True:
+            chunk = await reader.read(READ_SIZE)
+            if not chunk:
+                break
+            lines = (tail + chunk).split(b"\n")
+            # keep the partial last line until the rest of it arrives
+            tail = lines.pop()
+            if executor is None:
+                response = runLines(board, lines, syncLog)
+            else:
+                response = await loop.run_in_executor(executor, runLines, board, lines, syncLog)
+            if response:
+                writer.write(response)
+                await writer.drain()
+        if tail:
+            if executor is None:
+                writer.write(runLines(board, [tail], syncLog))
+            else:
+                writer.write(await loop.run_in_executor(executor, runLines, board, [tail], syncLog))
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+# The group commit latency bound also has to hold while no commands arrive. With an executor the flush waits for the
+# batch being applied, so it runs on the pool instead of stalling the event loop for every client.
+async def syncPeriodically(sync, delay, executor=None):
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(delay)
+        if executor is None:
+            sync()
+        else:
+            await loop.run_in_executor(executor, sync)
+
+# syncLog, if there is a write-ahead log, flushes it before every response and every syncDelay seconds
+async def serve(board, host, port, unixPath, executor=None, syncLog=None, syncDelay=0.0):
+    callback = lambda reader, writer: handleClient(board, reader, writer, executor, syncLog)
+    if unixPath:
+        server = await asyncio.start_unix_server(callback, path=unixPath)
+    else:
+        server = await asyncio.start_server(callback, host, port)
+    # with no delay every append syncs by itself, and a zero sleep would only spin the loop
+    syncer = None
+    if syncLog is not None and syncDelay > 0:
+        syncer = asyncio.ensure_future(syncPeriodically(syncLog, syncDelay, executor))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if syncer is not None:
+            syncer.cancel()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a GatorTaxi ride board over a line protocol.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=7878, help="TCP port to listen on (default: 7878)")
+    parser.add_argument("--unix", metavar="PATH", help="listen on a Unix socket instead of TCP")
+    parser.add_argument("--compact-tree", action="store_true", help="store the Red Black Tree in typed arrays instead of Node objects")
+    parser.add_argument("--lazy-heap", action="store_true", help="delete and update heap entries lazily through tombstones instead of sifting them")
+    parser.add_argument("--priority", choices=sorted(PRIORITY_POLICIES), default="cost", help="order in which GetNextRide hands out rides (default: cost)")
+    parser.add_argument("--surge", type=float, default=1.0, help="surcharge per minute of trip added to the cost by --priority surge (default: 1)")
+    parser.add_argument("--threads", type=int, default=0, help="run client batches on this many threads with concurrent reads (default: 0, on the event loop)")
+    parser.add_argument("--history", type=int, default=0, help="keep the board as of each of the last N mutations readable by PrintAt (default: 0, off)")
+    parser.add_argument("--load-snapshot", metavar="PATH", help="start from the rides in a binary snapshot instead of an empty board")
+    parser.add_argument("--wal", metavar="PATH", help="replay this write-ahead log on startup and append every mutation to it")
+    parser.add_argument("--wal-batch", type=int, default=1024, help="most mutations made durable by one fsync (default: 1024)")
+    parser.add_argument("--wal-delay", type=float, default=0.005, help="longest time in seconds a mutation waits for its fsync (default: 0.005)")
+    args = parser.parse_args(argv)
+
+    board = RideBoard(compactTree=args.compact_tree, lazyHeap=args.lazy_heap, priority=PRIORITY_POLICIES[args.priority](args.surge))
+    if args.history > 0:
+        board.enableHistory(args.history)
+    if args.load_snapshot:
+        load_snapshot(board, args.load_snapshot)
+    wal = None
+    if args.wal:
+        wal = WriteAheadLog(args.wal, args.wal_batch, args.wal_delay).open(board)
+    executor = None
+    syncLog = wal.sync if wal is not None else None
+    if args.threads > 0:
+        executor = ThreadPoolExecutor(args.threads)
+        board = ConcurrentBoard(board)
+        if wal is not None:
+            # the flush goes through the writer queue like a mutation, so it never races an append to the log's buffer
+            syncLog = lambda: board.submit(wal.sync).result()
+    try:
+        asyncio.run(serve(board, args.host, args.port, args.unix, executor, syncLog, args.wal_delay))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if wal is not None:
+            wal.close()
+
+if __name__ == "__main__":
+    main()
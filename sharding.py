@@ -0,0 +1,403 @@
+import argparse
+import multiprocessing
+import sys
+
+from gatorTaxi import CHUNK_SIZE, COMMANDS, MAX_RIDE_NUMBER, MIN_RIDE_NUMBER, RideBoard, formatRide, processCommands
+
+# SHARDED RIDE ENGINE
+# Rides are partitioned by rideNumber range across worker processes, each owning its own tree, heap and lookup
+# dictionary. The coordinator routes every command to the shard that owns its rideNumber and keeps the current
+# minimum of every shard so GetNextRide only has to ask the winning shard for its ride. GetNextRide(k) runs k such
+# tournaments.
+
+# Operation codes sent to the shard workers
+OP_INSERT = 0
+OP_UPDATE = 1
+OP_CANCEL = 2
+OP_PRINT = 3
+OP_PRINT_RANGE = 4
+OP_TAKE = 5
+OP_PEEK = 6
+# read-only queries, sent as (method name, arguments) and answered by that RideBoard method
+OP_QUERY = 7
+OP_TICK = 8
+
+# Commands queued for a shard are shipped once this many have accumulated, even without a query waiting on them
+BATCH_SIZE = 1024
+
+# Worker loop: apply every batch to the shard's board and answer with (duplicate seen, query result, current minimum)
+def shardWorker(conn, compactTree, lazyHeap):
+    board = RideBoard(compactTree=compactTree, lazyHeap=lazyHeap)
+    while True:
+        batch = conn.recv()
+        if batch is None:
+            break
+        duplicate = False
+        result = None
+        for op, args in batch:
+            if op == OP_INSERT:
+                if board.insert(*args) == 0:
+                    duplicate = True
+            elif op == OP_UPDATE:
+                board.update(*args)
+            elif op == OP_CANCEL:
+                board.cancel(*args)
+            elif op == OP_PRINT:
+                result = board.printRide(*args)
+            elif op == OP_PRINT_RANGE:
+                result = list(board.printRides(*args))
+            elif op == OP_PEEK:
+                result = board.peekNextRides(*args)
+            elif op == OP_QUERY:
+                result = getattr(board, args[0])(*args[1])
+            elif op == OP_TICK:
+                board.advance(*args)
+            else:
+                result = board.nextRide()
+        conn.send((duplicate, result, board.minHeap.minKey()))
+    conn.close()
+
+class ShardedBoard:
+    # Shard i owns the rideNumbers in [i * width, (i + 1) * width), the first and last shards also take anything
+    # below or above the configured range.
+    def __init__(self, shards, maxRideNumber, compactTree=False, lazyHeap=False):
+        self.width = maxRideNumber // shards + 1
+        self.conns = []
+        self.procs = []
+        for _ in range(shards):
+            parentConn, childConn = multiprocessing.Pipe()
+            proc = multiprocessing.Process(target=shardWorker, args=(childConn, compactTree, lazyHeap), daemon=True)
+            proc.start()
+            childConn.close()
+            self.conns.append(parentConn)
+            self.procs.append(proc)
+        # commands not yet shipped to each shard
+        self.pending = [[] for _ in range(shards)]
+        # batches shipped to each shard whose reply has not been read yet
+        self.outstanding = [0] * shards
+        # whether a shard has an insert whose duplicate check has not come back yet
+        self.unchecked = [False] * shards
+        # minimum (rideCost, tripDuration, rideNumber) of each shard as of its last reply
+        self.minima = [None] * shards
+        # set once a shard reports a duplicate rideNumber, the run has to stop there
+        self.duplicate = False
+
+    def shardOf(self, rideNumber):
+        return min(max(rideNumber // self.width, 0), len(self.conns) - 1)
+
+    def queue(self, shard, op, args):
+        pending = self.pending[shard]
+        pending.append((op, args))
+        if len(pending) >= BATCH_SIZE:
+            self.ship(shard)
+
+    def ship(self, shard):
+        self.conns[shard].send(self.pending[shard])
+        self.pending[shard] = []
+        self.outstanding[shard] += 1
+
+    # Ship the queued commands of the given shards and wait for all of their replies.
+    # The shards work on their batches in parallel while the coordinator waits on the first one.
+    def sync(self, shards):
+        for shard in shards:
+            if self.pending[shard]:
+                self.ship(shard)
+        result = None
+        for shard in shards:
+            conn = self.conns[shard]
+            while self.outstanding[shard]:
+                duplicate, result, self.minima[shard] = conn.recv()
+                self.outstanding[shard] -= 1
+                self.duplicate = self.duplicate or duplicate
+            self.unchecked[shard] = False
+        return result
+
+    # Before anything is printed every insert routed so far has to be checked for a duplicate, since the original
+    # program stops at the first duplicate rideNumber and prints nothing after it. Returns False if one turned up.
+    def checked(self):
+        self.sync([s for s, unchecked in enumerate(self.unchecked) if unchecked])
+        return not self.duplicate
+
+    # Ship one query to a shard behind whatever is queued for it and return the query's result
+    def ask(self, shard, op, args):
+        self.pending[shard].append((op, args))
+        self.ship(shard)
+        return self.sync([shard])
+
+    def insert(self, rideNumber, rideCost, tripDuration, ttl=0, pickup=None):
+        shard = self.shardOf(rideNumber)
+        self.unchecked[shard] = True
+        self.queue(shard, OP_INSERT, (rideNumber, rideCost, tripDuration, ttl, pickup))
+        return 1
+
+    # Every shard keeps its own expiry wheel, so the clock moves on all of them
+    def advance(self, t):
+        for shard in range(len(self.conns)):
+            self.queue(shard, OP_TICK, (t,))
+
+    def update(self, rideNumber, newTD):
+        self.queue(self.shardOf(rideNumber), OP_UPDATE, (rideNumber, newTD))
+
+    def cancel(self, rideNumber):
+        self.queue(self.shardOf(rideNumber), OP_CANCEL, (rideNumber,))
+
+    # The query methods return None once a duplicate rideNumber has been found
+    def printRide(self, rideNumber):
+        if not self.checked():
+            return None
+        return self.ask(self.shardOf(rideNumber), OP_PRINT, (rideNumber,))
+
+    def printRides(self, rideNumber1, rideNumber2):
+        if not self.checked():
+            return None
+        if rideNumber1 > rideNumber2:
+            return []
+        # only the shards overlapping the range are asked, their answers are already in rideNumber order
+        shards = range(self.shardOf(rideNumber1), self.shardOf(rideNumber2) + 1)
+        for shard in shards:
+            self.pending[shard].append((OP_PRINT_RANGE, (rideNumber1, rideNumber2)))
+            self.ship(shard)
+        rides = []
+        for shard in shards:
+            rides.extend(self.sync([shard]))
+        return rides
+
+    # Every shard with queued or unanswered commands has to report its minimum again before a tournament
+    def syncDirty(self):
+        self.sync([s for s in range(len(self.conns)) if self.pending[s] or self.outstanding[s] or self.unchecked[s]])
+
+    # Ask several shards the same order statistic query at once and return their answers in shard order
+    def query(self, shards, method, args):
+        if not self.checked():
+            return None
+        for shard in shards:
+            self.pending[shard].append((OP_QUERY, (method, args)))
+            self.ship(shard)
+        return [self.sync([shard]) for shard in shards]
+
+    # The order statistics combine per shard answers: shards hold disjoint, ordered rideNumber ranges, so a ride's
+    # rank is its rank within its shard plus the sizes of all lower shards
+    def count(self, rideNumber1, rideNumber2):
+        if rideNumber1 > rideNumber2:
+            return 0 if self.checked() else None
+        counts = self.query(range(self.shardOf(rideNumber1), self.shardOf(rideNumber2) + 1), "count", (rideNumber1, rideNumber2))
+        return None if counts is None else sum(counts)
+
+    def rank(self, rideNumber):
+        shard = self.shardOf(rideNumber)
+        answers = self.query(range(shard + 1), "count", (MIN_RIDE_NUMBER, MAX_RIDE_NUMBER))
+        if answers is None:
+            return None
+        rank = self.query([shard], "rank", (rideNumber,))[0]
+        return rank + sum(answers[:-1]) if rank else 0
+
+    def select(self, index):
+        sizes = self.query(range(len(self.conns)), "count", (MIN_RIDE_NUMBER, MAX_RIDE_NUMBER))
+        if sizes is None:
+            return None
+        for shard, size in enumerate(sizes):
+            if index <= size:
+                return self.query([shard], "select", (index,))[0] if index >= 1 else [0,0,0]
+            index -= size
+        return [0,0,0]
+
+    def printPage(self, rideNumber1, rideNumber2, offset, limit):
+        # the same empty pages as the single process printPage, a negative offset must not reach a shard
+        if rideNumber1 > rideNumber2 or offset < 0 or limit <= 0:
+            return [] if self.checked() else None
+        shards = range(self.shardOf(rideNumber1), self.shardOf(rideNumber2) + 1)
+        counts = self.query(shards, "count", (rideNumber1, rideNumber2))
+        if counts is None:
+            return None
+        rides = []
+        for shard, count in zip(shards, counts):
+            if len(rides) >= limit:
+                break
+            if offset >= count:
+                offset -= count
+                continue
+            rides.extend(self.query([shard], "printPage", (rideNumber1, rideNumber2, offset, limit - len(rides)))[0])
+            offset = 0
+        return rides
+
+    def nextRide(self):
+        self.syncDirty()
+        if self.duplicate:
+            return None
+        winner = None
+        for shard, key in enumerate(self.minima):
+            if key is not None and (winner is None or key < self.minima[winner]):
+                winner = shard
+        if winner is None:
+            return "No active ride requests"
+        return self.ask(winner, OP_TAKE, ())
+
+    def nextRides(self, k):
+        rides = []
+        while len(rides) < k:
+            l = self.nextRide()
+            if l is None:
+                return None
+            if l == "No active ride requests":
+                break
+            rides.append(l)
+        return rides
+
+    # Pickups are not partitioned by rideNumber, so every shard names its best ride near (x, y) and the winner is
+    # cancelled on its shard like any other ride leaving the board
+    def nextRideNear(self, x, y, radius):
+        candidates = self.query(range(len(self.conns)), "nearestRide", (x, y, radius))
+        if candidates is None:
+            return None
+        winner = None
+        for candidate in candidates:
+            if candidate is not None and (winner is None or candidate[0] < winner[0]):
+                winner = candidate
+        if winner is None:
+            return "No active ride requests"
+        l = winner[1]
+        self.cancel(l[0])
+        return l
+
+    # The k cheapest rides overall are among the k cheapest of every shard, so each shard peeks and the answers merge
+    def peekNextRides(self, k):
+        self.syncDirty()
+        if self.duplicate:
+            return None
+        shards = range(len(self.conns))
+        for shard in shards:
+            self.pending[shard].append((OP_PEEK, (k,)))
+            self.ship(shard)
+        rides = []
+        for shard in shards:
+            rides.extend(self.sync([shard]))
+        rides.sort(key=lambda l: (l[1], l[2], l[0]))
+        return rides[:k]
+
+    # Flush every shard, returns False if a duplicate rideNumber turned up in the commands that were still queued
+    def finish(self):
+        self.sync(range(len(self.conns)))
+        return not self.duplicate
+
+    def close(self):
+        for conn in self.conns:
+            conn.send(None)
+            conn.close()
+        for proc in self.procs:
+            proc.join()
+
+def runGetNextRide(board, args, out):
+    if args:
+        if args[0] <= 0:
+            return runInvalidCount(board, out)
+        return runRides(board.nextRides(args[0]), out)
+    l = board.nextRide()
+    if l is None:
+        out.append("Duplicate RideNumber")
+        return 0
+    out.append(l if l == "No active ride requests" else formatRide(l))
+
+def runGetNextRideNear(board, args, out):
+    l = board.nextRideNear(args[0], args[1], args[2])
+    if l is None:
+        out.append("Duplicate RideNumber")
+        return 0
+    out.append(l if l == "No active ride requests" else formatRide(l))
+
+def runPeekNextRides(board, args, out):
+    if args[0] <= 0:
+        return runInvalidCount(board, out)
+    return runRides(board.peekNextRides(args[0]), out)
+
+def runCount(board, args, out):
+    return runValue(board.count(args[0], args[1]), str, out)
+
+def runRank(board, args, out):
+    return runValue(board.rank(args[0]), str, out)
+
+def runSelect(board, args, out):
+    return runValue(board.select(args[0]), formatRide, out)
+
+def runPrintPage(board, args, out):
+    rides = board.printPage(args[0], args[1], args[2], args[3])
+    return runValue(rides, lambda rides: ",".join(map(formatRide, rides)) if rides else "(0,0,0)", out)
+
+# Print a query answer, or stop the run if a duplicate rideNumber turned up first
+def runValue(value, format, out):
+    if value is None:
+        out.append("Duplicate RideNumber")
+        return 0
+    out.append(format(value))
+
+# Reject a batch of no rides like the single process handlers do, once the inserts before it are known to be fine
+def runInvalidCount(board, out):
+    if not board.checked():
+        out.append("Duplicate RideNumber")
+        return 0
+    out.append("Invalid number of rides")
+
+# Print a batch of rides on one line, or stop the run if a duplicate rideNumber turned up first
+def runRides(rides, out):
+    if rides is None:
+        out.append("Duplicate RideNumber")
+        return 0
+    out.append(",".join(map(formatRide, rides)) if rides else "No active ride requests")
+
+def runPrint(board, args, out):
+    if len(args) == 1:
+        l = board.printRide(args[0])
+        if l is None:
+            out.append("Duplicate RideNumber")
+            return 0
+        out.append(formatRide(l))
+    else:
+        rides = board.printRides(args[0], args[1])
+        if rides is None:
+            out.append("Duplicate RideNumber")
+            return 0
+        out.append(",".join(map(formatRide, rides)) if rides else "(0,0,0)")
+
+# PrintAt and Stats answer without asking the shards, so the inserts queued before them have to be checked first
+def runPrintAt(board, args, out):
+    if not board.checked():
+        out.append("Duplicate RideNumber")
+        return 0
+    return COMMANDS["PrintAt"](board, args, out)
+
+def runStats(board, args, out):
+    if not board.checked():
+        out.append("Duplicate RideNumber")
+        return 0
+    return COMMANDS["Stats"](board, args, out)
+
+# Insert, UpdateTrip and CancelRide are only queued, so the single process handlers work unchanged
+SHARDED_COMMANDS = dict(COMMANDS, GetNextRide=runGetNextRide, GetNextRideNear=runGetNextRideNear,
+                        PeekNextRides=runPeekNextRides, Print=runPrint, Count=runCount, Rank=runRank, Select=runSelect,
+                        PrintPage=runPrintPage, PrintAt=runPrintAt, Stats=runStats)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay GatorTaxi commands against a ride board sharded across processes.")
+    parser.add_argument("input", help="file with one command per line, or - to read from stdin")
+    parser.add_argument("output", nargs="?", default="output_file.txt", help="where to write the results, or - for stdout (default: output_file.txt)")
+    parser.add_argument("--shards", type=int, default=multiprocessing.cpu_count(), help="number of worker processes (default: one per core)")
+    parser.add_argument("--max-ride-number", type=int, default=1000000, help="rideNumbers 0..N are split evenly across the shards (default: 1000000)")
+    parser.add_argument("--compact-tree", action="store_true", help="store each shard's Red Black Tree in typed arrays instead of Node objects")
+    parser.add_argument("--lazy-heap", action="store_true", help="delete and update heap entries lazily through tombstones instead of sifting them")
+    args = parser.parse_args(argv)
+
+    board = ShardedBoard(args.shards, args.max_ride_number, compactTree=args.compact_tree, lazyHeap=args.lazy_heap)
+    fread = sys.stdin if args.input == "-" else open(args.input, 'r', buffering=CHUNK_SIZE)
+    fwrite = sys.stdout if args.output == "-" else open(args.output, 'w', buffering=CHUNK_SIZE)
+    try:
+        # a duplicate among the last queued inserts only shows up once the shards are flushed
+        if processCommands(board, fread, fwrite, commands=SHARDED_COMMANDS) and not board.finish():
+            fwrite.write("Duplicate RideNumber\n")
+    finally:
+        board.close()
+        if fwrite is not sys.stdout:
+            fwrite.close()
+        if fread is not sys.stdin:
+            fread.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from gatorTaxi import WHEEL_BITS, WHEEL_LEVELS, Ride, RideBoard, TimingWheel
+
+class TimingWheelTest(unittest.TestCase):
+    # a deadline past the top level goes to the overflow slot instead of failing the insert
+    def testOverflowDeadline(self):
+        board = RideBoard()
+        self.assertEqual(board.insert(1, 5, 5, 5000000000000), 1)
+        self.assertEqual(board.sequence, 1)
+        self.assertEqual(board.advance(4999999999999), [])
+        self.assertEqual([ride.rideNumber for ride in board.advance(5000000000000)], [1])
+        self.assertEqual(board.count(0, 10), 0)
+
+    def testOverflowAfterTick(self):
+        wheel = TimingWheel()
+        top = 1 << (WHEEL_BITS * WHEEL_LEVELS)
+        # crossing the boundary above the overflow slot as well
+        boundary = top << WHEEL_BITS
+        wheel.advance(boundary - 3)
+        wheel.schedule(Ride(1, 1, 1), boundary + 5)
+        self.assertEqual(wheel.advance(boundary + 4), [])
+        self.assertEqual([ride.rideNumber for ride in wheel.advance(boundary + 5)], [1])
+
+    # every ride expires on the first advance that reaches its deadline, checked against a plain scan
+    def testAdvanceMatchesBruteForce(self):
+        rng = random.Random(15)
+        top = 1 << (WHEEL_BITS * WHEEL_LEVELS)
+        for _ in range(20):
+            wheel = TimingWheel(now=rng.choice([0, top - 100, rng.randrange(top)]))
+            deadlines = {}
+            rideNumber = 0
+            for _ in range(200):
+                if rng.random() < 0.6:
+                    rideNumber += 1
+                    deadline = wheel.now + rng.choice([1, rng.randrange(1, 100), rng.randrange(1, top), rng.randrange(1, 4 * top), rng.randrange(1, top << 12)])
+                    wheel.schedule(Ride(rideNumber, 1, 1), deadline)
+                    deadlines[rideNumber] = deadline
+                else:
+                    t = wheel.now + rng.choice([1, rng.randrange(100), rng.randrange(top)])
+                    expected = sorted(n for n, deadline in deadlines.items() if deadline <= t)
+                    self.assertEqual(sorted(ride.rideNumber for ride in wheel.advance(t)), expected)
+                    for n in expected:
+                        del deadlines[n]
+
+if __name__ == "__main__":
+    unittest.main()